@@ -0,0 +1,176 @@
+"""
+Benchmark: sequential vs concurrent ad generation against a fake OpenAI endpoint.
+
+Starts a local aiohttp server that mimics /v1/chat/completions with injected latency,
+then times the old one-cluster-at-a-time loop against AdGenerator.generate_ads_batch,
+one cluster per request and packed (several clusters per request). All calls go
+through an LLMGateway, so injected 429/500 answers are retried and the RPM/TPM buckets apply.
+Streamed runs (stream=True, answered as server-sent events) also report the time until
+the first complete ad reaches the caller.
+
+Usage (from the repo root):
+    python -m benchmarks.bench_ad_generation --clusters 40 --latency 1.5 --jitter 0.5
+    python -m benchmarks.bench_ad_generation --rate-limit-rate 0.1 --rpm 120
+    python -m benchmarks.bench_ad_generation --slow-rate 0.05 --clusters 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import time
+
+from aiohttp import web
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+from openai import AsyncOpenAI
+from services.ad_generator import AdGenerator
+from services.llm_gateway import LLMGateway
+
+FAKE_AD = {
+    "headline_1": "Пластиковые окна от производителя",
+    "headline_2": "Скидка 30% до конца месяца",
+    "text": "Замер бесплатно. Монтаж за 1 день. Гарантия 10 лет. Звоните!",
+    "path": "okna"
+}
+
+
+PACK_ID_RE = re.compile(r"- id (\d+):")
+
+
+async def stream_response(request: web.Request, content: str, duration: float, pieces: int = 20) -> web.StreamResponse:
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    step = max(1, len(content) // pieces)
+    try:
+        for start in range(0, len(content), step):
+            chunk = {
+                "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()), "model": "gpt-4o",
+                "choices": [{"index": 0, "delta": {"content": content[start:start + step]}, "finish_reason": None}]
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            await asyncio.sleep(duration / pieces)
+        usage = {
+            "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()), "model": "gpt-4o",
+            "choices": [], "usage": {"prompt_tokens": 200, "completion_tokens": 60, "total_tokens": 260}
+        }
+        await response.write(f"data: {json.dumps(usage)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        await response.write_eof()
+    except ConnectionResetError:
+        pass  # The client dropped the stream (a hedge won)
+    return response
+
+
+def make_app(latency: float, jitter: float, error_rate: float, drop_rate: float,
+             rate_limit_rate: float, slow_rate: float) -> web.Application:
+    stats = {"requests": 0}
+
+    async def chat_completions(request: web.Request) -> web.Response:
+        body = await request.json()
+        stats["requests"] += 1
+        prompt = body["messages"][-1]["content"]
+        pack_ids = PACK_ID_RE.findall(prompt)
+        # Packed prompts take longer to answer: output grows with the number of clusters
+        total_latency = max(0.0, latency * (1 + 0.15 * len(pack_ids)) + random.uniform(-jitter, jitter))
+        if random.random() < slow_rate:
+            total_latency *= 8  # Straggler: what hedging is for
+        # A streamed answer starts after the first-token delay and spreads the rest over its chunks
+        await asyncio.sleep(total_latency * (0.2 if body.get("stream") else 1.0))
+        if random.random() < error_rate:
+            return web.json_response({"error": {"message": "injected failure", "type": "server_error"}}, status=500)
+        if random.random() < rate_limit_rate:
+            return web.json_response({"error": {"message": "injected rate limit", "type": "rate_limit_exceeded"}},
+                                     status=429, headers={"retry-after": "0.5"})
+
+        if pack_ids:
+            # Drop some clusters from packed answers to exercise the per-cluster retry
+            payload = {"clusters": {i: [FAKE_AD] for i in pack_ids if random.random() >= drop_rate}}
+        else:
+            payload = {"ads": [FAKE_AD]}
+        content = json.dumps(payload, ensure_ascii=False)
+
+        if body.get("stream"):
+            return await stream_response(request, content, total_latency * 0.8)
+
+        return web.json_response({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "gpt-4o",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 200, "completion_tokens": 60, "total_tokens": 260}
+        })
+
+    app = web.Application()
+    app["stats"] = stats
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+async def run(args):
+    app = make_app(args.latency, args.jitter, args.error_rate, args.drop_rate, args.rate_limit_rate, args.slow_rate)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    client = AsyncOpenAI(api_key="sk-bench", base_url=f"http://127.0.0.1:{port}/v1", max_retries=0)
+    gateway = LLMGateway(client=client, rpm=args.rpm, tpm=args.tpm, max_concurrency=64)
+    generator = AdGenerator(gateway=gateway)
+    groups = [(f"Гр: кластер {i}", [f"фраза {i} {j}" for j in range(15)]) for i in range(args.clusters)]
+
+    try:
+        start = time.perf_counter()
+        sequential = []
+        for name, keywords in groups:
+            sequential.append(await generator.generate_ads(name, keywords, count=1, use_cache=False))
+        seq_time = time.perf_counter() - start
+        print(f"{'sequential':<24}: {seq_time:7.2f}s  ({sum(1 for a in sequential if a)}/{len(groups)} ok)")
+
+        for streamed in (False, True):
+            for packed in (False, True):
+                for concurrency in args.concurrency:
+                    app["stats"]["requests"] = 0
+                    first_ad = []
+
+                    async def on_ad(index: int, ad: dict):
+                        if not first_ad:
+                            first_ad.append(time.perf_counter() - start)
+
+                    start = time.perf_counter()
+                    concurrent = await generator.generate_ads_batch(groups, count=1, concurrency=concurrency,
+                                                                    use_cache=False, packed=packed,
+                                                                    on_ad=on_ad if streamed else None)
+                    elapsed = time.perf_counter() - start
+                    label = f"{'packed' if packed else 'single'}{'+stream' if streamed else ''} c={concurrency}"
+                    first = f", first ad {first_ad[0]:.2f}s" if first_ad else ""
+                    print(f"{label:<24}: {elapsed:7.2f}s  ({sum(1 for a in concurrent if a)}/{len(groups)} ok, "
+                          f"{app['stats']['requests']} requests, x{seq_time / elapsed:.1f}{first})")
+        print(f"gateway: {gateway.summary()}, max queue depth {gateway.stats['max_queue_depth']}")
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clusters", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=1.5, help="Mean fake completion latency, seconds")
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with HTTP 429")
+    parser.add_argument("--slow-rate", type=float, default=0.0,
+                        help="Share of requests answered 8x slower (exercises hedging)")
+    parser.add_argument("--rpm", type=int, default=10000, help="Gateway requests-per-minute bucket")
+    parser.add_argument("--tpm", type=int, default=10000000, help="Gateway tokens-per-minute bucket")
+    parser.add_argument("--drop-rate", type=float, default=0.05,
+                        help="Share of clusters left out of packed answers")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 8, 16])
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,114 @@
+"""
+Benchmark: memory of the list-of-dicts campaign vs the columnar Campaign model.
+
+Builds the same synthetic campaign both ways and measures, with tracemalloc:
+  - model:  memory held by the campaign representation itself
+  - export: peak while both exporters walk it (the legacy path materialised one
+            per-keyword row list for Excel and another for Sheets)
+
+Usage (from the repo root):
+    python -m benchmarks.bench_campaign_model --keywords 200000 --groups 500
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from benchmarks.bench_clustering import make_keywords
+from services.campaign_model import Campaign
+
+AD = {
+    "headline_1": "Пластиковые окна от производителя",
+    "headline_2": "Скидка 30% до конца месяца",
+    "text": "Замер бесплатно. Монтаж за 1 день. Гарантия 10 лет. Звоните!",
+    "path": "okna"
+}
+
+
+def split_groups(keywords: list[str], groups: int) -> list[str]:
+    """
+    Groups as newline-joined blocks, so each builder creates (and owns) its phrase objects,
+    as when they come out of project state.
+    """
+    size = max(1, len(keywords) // groups)
+    return ["\n".join(keywords[i:i + size]) for i in range(0, len(keywords), size)]
+
+
+def build_legacy(chunks: list[str]) -> list[dict]:
+    # Ads come back from the LLM as fresh dicts per group
+    groups = []
+    for chunk in chunks:
+        keywords = chunk.split("\n")
+        groups.append({"group_name": f"Гр: {keywords[0]}", "keywords": keywords, "ads": [dict(AD)]})
+    return groups
+
+
+def export_legacy(campaign_name: str, campaign_data: list[dict]) -> int:
+    excel_rows = []
+    for group in campaign_data:
+        ad = group["ads"][0]
+        for kw in group["keywords"]:
+            excel_rows.append({
+                "Campaign Name": campaign_name, "Group Name": group["group_name"], "Phrase": kw,
+                "Headline 1": ad.get("headline_1", ""), "Headline 2": ad.get("headline_2", ""),
+                "Text": ad.get("text", ""), "Path": ad.get("path", ""), "Link": ad.get("link", "https://example.com")
+            })
+    sheet_rows = []
+    for group in campaign_data:
+        ad = group["ads"][0]
+        for kw in group["keywords"]:
+            sheet_rows.append([group["group_name"], kw, ad.get("headline_1", ""), ad.get("headline_2", ""),
+                               ad.get("text", ""), ad.get("path", "")])
+    return len(excel_rows) + len(sheet_rows)
+
+
+def build_columnar(chunks: list[str]) -> Campaign:
+    campaign = Campaign("Campaign_bench")
+    for chunk in chunks:
+        keywords = chunk.split("\n")
+        campaign.add_group(f"Гр: {keywords[0]}", keywords, [dict(AD)])
+    return campaign
+
+
+def export_columnar(campaign: Campaign) -> int:
+    rows = 0
+    for _ in campaign.iter_rows():  # Excel writer
+        rows += 1
+    for _ in campaign.iter_rows(require_ad=False):  # Sheets writer
+        rows += 1
+    return rows
+
+
+def measure(build, export, chunks):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    model = build(chunks)
+    model_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    rows = export(model)
+    _, export_peak = tracemalloc.get_traced_memory()
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+    return model_bytes, export_peak, rows, elapsed
+
+
+def run(args):
+    keywords = make_keywords(args.keywords)
+    chunks = split_groups(keywords, args.groups)
+    print(f"{len(keywords)} keywords in {len(chunks)} groups")
+    print(f"{'model':<10} {'model MB':>9} {'export peak MB':>15} {'rows':>8} {'time s':>7}")
+
+    results = {
+        "legacy": measure(build_legacy, lambda data: export_legacy("Campaign_bench", data), chunks),
+        "columnar": measure(build_columnar, export_columnar, chunks)
+    }
+    for name, (model_bytes, export_peak, rows, elapsed) in results.items():
+        print(f"{name:<10} {model_bytes / 2**20:>9.1f} {export_peak / 2**20:>15.1f} {rows:>8} {elapsed:>7.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keywords", type=int, default=200000)
+    parser.add_argument("--groups", type=int, default=500)
+    run(parser.parse_args())
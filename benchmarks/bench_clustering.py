@@ -0,0 +1,101 @@
+"""
+Benchmark: standard (TF-IDF + KMeans) vs large (hashing + SVD + mini-batch) clustering.
+
+Generates synthetic Russian keyword sets of increasing size and runs each mode in a
+fresh process, so the reported peak RSS belongs to that run alone.
+
+Usage (from the repo root):
+    python -m benchmarks.bench_clustering --sizes 10000 50000 100000 200000 --clusters 50
+"""
+import argparse
+import multiprocessing
+import random
+import resource
+import sys
+import time
+
+PRODUCTS = [
+    "пластиковые окна", "ремонт квартир", "натяжные потолки", "диван", "кухня на заказ",
+    "шкаф купе", "ламинат", "межкомнатные двери", "входные двери", "кондиционер",
+    "стиральная машина", "холодильник", "ноутбук", "смартфон", "велосипед",
+    "детская коляска", "автошины", "аккумулятор", "строительство дома", "баня из бруса",
+    "септик", "скважина на воду", "газон", "тротуарная плитка", "забор из профнастила"
+]
+INTENTS = [
+    "купить", "цена", "стоимость", "недорого", "отзывы", "заказать", "со скидкой",
+    "официальный сайт", "каталог", "доставка", "в кредит", "рассрочка", "б у", "под ключ",
+    "своими руками", "рейтинг", "лучшие", "фото", "размеры", "установка"
+]
+CITIES = [
+    "москва", "санкт петербург", "казань", "екатеринбург", "новосибирск", "нижний новгород",
+    "самара", "краснодар", "ростов на дону", "уфа", "пермь", "воронеж", "волгоград", "тюмень"
+]
+EXTRAS = ["", "", "", "2024", "с установкой", "от производителя", "в наличии", "акция", "круглосуточно"]
+
+
+def make_keywords(count: int, seed: int = 42) -> list[str]:
+    rng = random.Random(seed)
+    keywords = set()
+    while len(keywords) < count:
+        parts = [rng.choice(PRODUCTS), rng.choice(INTENTS)]
+        if rng.random() < 0.7:
+            parts.append(rng.choice(CITIES))
+        extra = rng.choice(EXTRAS)
+        if extra:
+            parts.append(extra)
+        rng.shuffle(parts)
+        # Long-tail suffix keeps large sets unique
+        keywords.add(" ".join(parts) + (f" {rng.randint(1, 999)}" if len(keywords) > count // 2 else ""))
+    return list(keywords)
+
+
+def _worker(size: int, n_clusters: int, large: bool, queue):
+    from services.clustering_service import ClusteringService
+
+    keywords = make_keywords(size)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    labels = ClusteringService().fit_labels(keywords, n_clusters, large=large)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    queue.put((elapsed, peak / scale, (peak - baseline) / scale, len(set(labels))))
+
+
+def measure(size: int, n_clusters: int, large: bool, timeout: float):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_worker, args=(size, n_clusters, large, queue))
+    process.start()
+    process.join(timeout)
+    if process.is_alive():
+        process.terminate()
+        return None
+    return queue.get() if not queue.empty() else None
+
+
+def run(args):
+    print(f"{'size':>8} {'mode':<9} {'time s':>8} {'peak MB':>9} {'+MB':>8} {'clusters':>9}")
+    for size in args.sizes:
+        for large in (False, True):
+            mode = "large" if large else "standard"
+            if not large and size > args.max_standard:
+                print(f"{size:>8} {mode:<9} {'skipped (--max-standard)':>36}")
+                continue
+            result = measure(size, args.clusters, large, args.timeout)
+            if result is None:
+                print(f"{size:>8} {mode:<9} {'timed out / crashed':>36}")
+                continue
+            elapsed, peak_mb, delta_mb, found = result
+            print(f"{size:>8} {mode:<9} {elapsed:>8.2f} {peak_mb:>9.0f} {delta_mb:>8.0f} {found:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 100000, 200000])
+    parser.add_argument("--clusters", type=int, default=50)
+    parser.add_argument("--max-standard", type=int, default=200000,
+                        help="Skip the standard mode above this size")
+    parser.add_argument("--timeout", type=float, default=1800)
+    run(parser.parse_args())
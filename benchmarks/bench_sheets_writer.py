@@ -0,0 +1,180 @@
+"""
+Benchmark: per-report Sheets writes vs the coalescing SheetsWriter, against a fake spreadsheet.
+
+The fake master spreadsheet keeps tabs and cells in memory, adds per-call latency and
+enforces a write quota (--quota requests per rolling minute, answered with HTTP 429 like
+Google does); --rate-limit-rate injects extra random 429s. Many pipelines finish at once:
+  - direct: every report calls SheetsService.create_report_sheet (2+ calls each, no retry)
+  - writer: every report goes through SheetsWriter.write_report (batched, quota-aware)
+Each run checks that every successful tab holds all of its rows.
+
+Usage (from the repo root):
+    python -m benchmarks.bench_sheets_writer --reports 100 --quota 60
+    python -m benchmarks.bench_sheets_writer --reports 300 --max-rows 20000 --rate-limit-rate 0.2
+"""
+import argparse
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import deque
+
+import gspread
+
+from config import config
+from services.campaign_model import Campaign
+from services.sheets_service import SheetsService
+from services.sheets_writer import SheetsWriter
+
+RANGE_RE = re.compile(r"^'(.*)'!A(\d+)$")
+
+
+class FakeResponse:
+    def __init__(self, code: int, message: str):
+        self.status_code = code
+        self.text = message
+        self.headers = {}
+        self._body = {"error": {"code": code, "message": message, "status": "FAKE"}}
+
+    def json(self):
+        return self._body
+
+
+class FakeWorksheet:
+    def __init__(self, sheet_id: int, title: str):
+        self.id = sheet_id
+        self.title = title
+        self.rows = {}  # Row number -> values
+
+
+class FakeSpreadsheet:
+    url = "https://docs.google.com/spreadsheets/d/fake"
+
+    def __init__(self, quota: int, latency: float, rate_limit_rate: float):
+        self.quota = quota
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.tabs = {0: FakeWorksheet(0, "Лист1")}
+        self.calls = deque()  # Accepted write timestamps, rolling minute
+        self.lock = threading.Lock()
+        self.stats = {"writes": 0, "rate_limited": 0}
+
+    def _write(self):
+        time.sleep(self.latency)
+        with self.lock:
+            now = time.monotonic()
+            while self.calls and now - self.calls[0] > 60:
+                self.calls.popleft()
+            if len(self.calls) >= self.quota or random.random() < self.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                raise gspread.exceptions.APIError(FakeResponse(429, "Quota exceeded for 'Write requests per minute'"))
+            self.calls.append(now)
+            self.stats["writes"] += 1
+
+    def worksheets(self):
+        return list(self.tabs.values())
+
+    def batch_update(self, body: dict):
+        self._write()
+        with self.lock:
+            titles = {ws.title for ws in self.tabs.values()}
+            added = []
+            for request in body["requests"]:
+                if "addSheet" in request:
+                    props = request["addSheet"]["properties"]
+                    if props["title"] in titles or props["sheetId"] in self.tabs:
+                        raise gspread.exceptions.APIError(FakeResponse(400, f"Sheet '{props['title']}' exists"))
+                    titles.add(props["title"])
+                    added.append(FakeWorksheet(props["sheetId"], props["title"]))
+            for ws in added:  # All or nothing, like the real batch
+                self.tabs[ws.id] = ws
+
+    def values_batch_update(self, body: dict):
+        self._write()
+        with self.lock:
+            by_title = {ws.title: ws for ws in self.tabs.values()}
+            for entry in body["data"]:
+                title, start = RANGE_RE.match(entry["range"]).groups()
+                ws = by_title[title.replace("''", "'")]
+                for offset, row in enumerate(entry["values"]):
+                    ws.rows[int(start) + offset] = row
+
+
+class FakeClient:
+    def __init__(self, sh: FakeSpreadsheet):
+        self.sh = sh
+
+    def open_by_key(self, key: str):
+        return self.sh
+
+
+def make_campaigns(reports: int, min_rows: int, max_rows: int) -> list[Campaign]:
+    campaigns = []
+    for i in range(reports):
+        campaign = Campaign(f"Campaign_{i}")
+        size = random.randint(min_rows, max_rows)
+        for group in range(0, size, 50):
+            keywords = [f"запрос {i} {n}" for n in range(group, min(size, group + 50))]
+            campaign.add_group(f"Группа {group // 50}", keywords, [{"headline_1": "Окна", "text": "Текст"}])
+        campaigns.append(campaign)
+    return campaigns
+
+
+def verify(sh: FakeSpreadsheet, urls: list, campaigns: list[Campaign]) -> int:
+    complete = 0
+    for url, campaign in zip(urls, campaigns):
+        if not url:
+            continue
+        ws = sh.tabs[int(url.rsplit("gid=", 1)[1])]
+        if len(ws.rows) == len(campaign) + 1 and ws.rows[1][0] == "Группа":
+            complete += 1
+    return complete
+
+
+async def run_direct(campaigns, args):
+    sh = FakeSpreadsheet(args.quota, args.latency, args.rate_limit_rate)
+    service = SheetsService()
+    service.gc = FakeClient(sh)
+    start = time.perf_counter()
+    urls = await asyncio.gather(*(service.create_report_sheet(i, "окна", c) for i, c in enumerate(campaigns)))
+    return sh, urls, time.perf_counter() - start
+
+
+async def run_writer(campaigns, args):
+    sh = FakeSpreadsheet(args.quota, args.latency, args.rate_limit_rate)
+    writer = SheetsWriter(open_spreadsheet=lambda: sh, rpm=args.quota)
+    start = time.perf_counter()
+    urls = await asyncio.gather(*(writer.write_report(i, "окна", c) for i, c in enumerate(campaigns)))
+    elapsed = time.perf_counter() - start
+    await writer.close()
+    return sh, urls, elapsed
+
+
+async def main(args):
+    random.seed(args.seed)
+    config.GOOGLE_MASTER_SHEET_ID = "fake"
+    config.SHEETS_BACKOFF_BASE = args.backoff
+    campaigns = make_campaigns(args.reports, args.min_rows, args.max_rows)
+    total_rows = sum(len(c) for c in campaigns)
+    print(f"{args.reports} reports, {total_rows} rows, quota {args.quota} writes/min, "
+          f"latency {args.latency}s, extra 429 rate {args.rate_limit_rate}")
+    print(f"{'mode':<8} {'ok':>5} {'complete':>9} {'writes':>7} {'429s':>6} {'time s':>7}")
+    for name, run in (("direct", run_direct), ("writer", run_writer)):
+        sh, urls, elapsed = await run(campaigns, args)
+        ok = sum(1 for url in urls if url)
+        print(f"{name:<8} {ok:>5} {verify(sh, urls, campaigns):>9} {sh.stats['writes']:>7} "
+              f"{sh.stats['rate_limited']:>6} {elapsed:>7.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", type=int, default=100)
+    parser.add_argument("--min-rows", type=int, default=50)
+    parser.add_argument("--max-rows", type=int, default=3000)
+    parser.add_argument("--quota", type=int, default=60, help="Write requests per rolling minute")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of extra random 429s")
+    parser.add_argument("--backoff", type=float, default=0.2, help="SHEETS_BACKOFF_BASE for the run")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,71 @@
+"""
+Benchmark: streaming text extractor vs the previous BeautifulSoup path.
+
+Runs both on every page in benchmarks/html_corpus (saved landing pages with the
+usual inline styles, state blobs and SVG sprites), checks that they produce the
+same text and reports the mean time per page.
+
+Needs beautifulsoup4 (pip install -r benchmarks/requirements.txt).
+
+Usage (from the repo root):
+    python -m benchmarks.bench_text_extraction --repeat 20 --max-chars 4000
+"""
+import argparse
+import os
+import time
+
+from bs4 import BeautifulSoup
+
+from services.text_extractor import extract_text, etree
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "html_corpus")
+
+
+def legacy_extract(html: str, max_chars: int) -> str:
+    # The extraction ParserService.fetch_text used before the dedicated extractor
+    soup = BeautifulSoup(html, 'html.parser')
+    for element in soup(['script', 'style', 'header', 'footer', 'nav', 'noscript', 'iframe', 'svg']):
+        element.decompose()
+    text = soup.get_text(separator=' ', strip=True)
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    cleaned_text = ' '.join(lines)
+    if len(cleaned_text) > max_chars:
+        cleaned_text = cleaned_text[:max_chars] + "..."
+    return cleaned_text
+
+
+def timed(fn, html: str, max_chars: int, repeat: int) -> tuple[float, str]:
+    result = fn(html, max_chars)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(html, max_chars)
+    return (time.perf_counter() - start) / repeat, result
+
+
+def run(args):
+    backend = "lxml" if etree is not None else "html.parser (stdlib)"
+    print(f"extractor backend: {backend}, max_chars={args.max_chars}, repeat={args.repeat}\n")
+    print(f"{'page':<24} {'size':>8} {'bs4 ms':>9} {'new ms':>9} {'speedup':>8}  same")
+
+    total_old = total_new = 0.0
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        if not name.endswith(".html"):
+            continue
+        with open(os.path.join(CORPUS_DIR, name), encoding="utf-8") as f:
+            html = f.read()
+
+        old_time, old_text = timed(legacy_extract, html, args.max_chars, args.repeat)
+        new_time, new_text = timed(extract_text, html, args.max_chars, args.repeat)
+        total_old += old_time
+        total_new += new_time
+        print(f"{name:<24} {len(html) // 1024:>6}KB {old_time * 1000:>9.1f} {new_time * 1000:>9.1f} "
+              f"{old_time / new_time:>7.1f}x  {'yes' if old_text == new_text else 'NO'}")
+
+    print(f"\n{'total':<33} {total_old * 1000:>9.1f} {total_new * 1000:>9.1f} {total_old / total_new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--max-chars", type=int, default=4000)
+    run(parser.parse_args())
@@ -1,3 +1,5 @@
+import asyncio
+import time
 from aiogram import Router, F, types
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
@@ -6,16 +8,23 @@ from bot.keyboards.main_kb import get_main_kb
 from services.yandex_api import yandex_service
 from services.ad_generator import ad_generator
 from services.clustering_service import clustering_service
+from services.dedup_service import dedup_service, DedupResult
+from services.campaign_model import Campaign
+from services.project_store import project_store
 from services.excel_service import excel_service
-from services.sheets_service import sheets_service
+from services.sheets_writer import sheets_writer
 from services.parser_service import parser_service
 from services.openai_service import openai_service
+from services.url_cache import url_cache
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from config import config
 from utils.logger import get_logger
 
 logger = get_logger("handlers")
 router = Router()
 
+PREVIEW_GROUPS = 3 # Finished groups shown in the status message while ads are written
+
 @router.message(Command("start"))
 async def cmd_start(message: types.Message, state: FSMContext):
     await state.clear()
@@ -47,13 +56,42 @@ async def btn_analyze(message: types.Message, state: FSMContext):
     await message.answer("Отправьте ссылку на сайт (landing page), который нужно проанализировать:")
     await state.set_state(BotStates.waiting_for_url)
 
+@router.message(F.text == "Дополнить кампанию")
+async def btn_additions(message: types.Message, state: FSMContext):
+    data = await state.get_data()
+    if not data.get("last_project"):
+        await message.answer("Сначала соберите кампанию — дополнять пока нечего.")
+        return
+    await message.answer(
+        f"Пришлите новые фразы для кампании «{data.get('last_seed')}» (каждая с новой строки).\n"
+        "Они попадут в подходящие группы, объявления перепишутся только там, где группа заметно выросла."
+    )
+    await state.set_state(BotStates.waiting_for_additions)
+
+def parse_phrase_list(raw_text: str) -> list[str]:
+    # Split by lines and clean
+    return [line.strip() for line in raw_text.split('\n') if line.strip()]
+
+@router.message(BotStates.waiting_for_additions)
+async def process_additions(message: types.Message, state: FSMContext):
+    if not message.text: return
+
+    phrases = parse_phrase_list(message.text)
+    if not phrases:
+        await message.answer("Список пуст.")
+        return
+
+    data = await state.get_data()
+    semantics = [(p, 0) for p in phrases]
+    await run_pipeline(message, state, semantics, data.get("last_seed", "Кампания"),
+                       project_id=data["last_project"], incremental=True)
+
 @router.message(BotStates.waiting_for_list)
 async def process_manual_list(message: types.Message, state: FSMContext):
     raw_text = message.text
     if not raw_text: return
     
-    # Split by lines and clean
-    phrases = [line.strip() for line in raw_text.split('\n') if line.strip()]
+    phrases = parse_phrase_list(raw_text)
     
     if not phrases:
         await message.answer("Список пуст.")
@@ -65,74 +103,155 @@ async def process_manual_list(message: types.Message, state: FSMContext):
     
     await run_pipeline(message, state, semantics, seed_word)
 
-async def run_pipeline(message: types.Message, state: FSMContext, semantics: list, seed_word: str, context: str = None):
-    """Reusable pipeline logic"""
+def group_name_for(cluster_id: int, group_keywords: list[str]) -> str:
+    if group_keywords:
+        return f"Гр: {group_keywords[0]}"
+    return f"Группа {cluster_id}"
+
+async def run_pipeline(message: types.Message, state: FSMContext, semantics: list, seed_word: str, context: str = None,
+                       project_id: str = None, incremental: bool = False):
+    """
+    Reusable pipeline logic.
+    Clusters and ads are persisted per project. incremental=True adds the phrases to the
+    project's existing clusters and regenerates ads only for groups that changed materially.
+    """
     status_msg = await message.answer(f"✅ Принято {len(semantics)} фраз.\n🧠 Кластеризация и группировка...")
+    project_id = project_id or f"{message.chat.id}_{seed_word}"
     
+    # Collapse near-duplicates: cluster and prompt with canonical phrases only
+    if config.DEDUP_ENABLED:
+        dedup = await asyncio.to_thread(dedup_service.collapse, semantics)
+    else:
+        dedup = DedupResult(semantics=semantics)
+
     # Just list of strings for clustering
-    phrases = [s[0] for s in semantics]
+    phrases = [s[0] for s in dedup.semantics]
     
-    # 2. Cluster
+    # 2. Cluster (a full rebuild, or only the new phrases assigned to existing clusters)
     try:
-        clusters = clustering_service.cluster_keywords(phrases)
+        added = await clustering_service.update_project_async(project_id, phrases, rebuild=not incremental)
+        project = await asyncio.to_thread(project_store.load_state, project_id)
     except Exception as e:
         logger.error(f"Cluster fail: {e}")
+        project = None
+    if not project:
         await status_msg.edit_text("❌ Ошибка кластеризации.")
         return
+
+    clusters = project["clusters"]
+    # Merge the new duplicates into the stored groups; a phrase belongs to one canonical only
+    owner = {phrase: canonical for canonical, group in project["members"].items() for phrase in group}
+    for canonical, group in dedup.members.items():
+        target = owner.get(canonical, canonical)
+        phrases = [phrase for phrase in dict.fromkeys(phrase for phrase, _ in group)
+                   if owner.get(phrase, target) == target]
+        if len(phrases) > 1 or target != canonical:
+            merged = project["members"].setdefault(target, [target])
+            merged.extend(phrase for phrase in phrases if phrase not in merged)
+    project["shows"].update((phrase, shows) for phrase, shows in semantics if shows)
+    stale = project_store.stale_clusters(project)
+
+    if incremental:
+        await status_msg.edit_text(
+            f"✅ Добавлено {added} новых фраз в {len(clusters)} групп.\n"
+            f"✍️ Обновляю объявления в {len(stale)} группах..."
+        )
+    else:
+        await status_msg.edit_text(f"✅ Кластеризовано на {len(clusters)} групп.\n✍️ Написание объявлений (это может занять время)...")
     
-    await status_msg.edit_text(f"✅ Кластеризовано на {len(clusters)} групп.\n✍️ Написание объявлений (это может занять время)...")
-    
-    # 3. Generate Ads & Prepare Data
-    campaign_data = [] # List of dicts for export
-    
-    total_clusters = len(clusters)
-    for i, (cluster_id, group_keywords) in enumerate(clusters.items()):
-        group_name = f"Группа {cluster_id}"
-        if group_keywords:
-             group_name = f"Гр: {group_keywords[0]}"
-
-        # Update progress
-        if i % 2 == 0:
-             await status_msg.edit_text(f"✍️ Пишу объявления: {i+1}/{total_clusters}...")
-        
-        # Generate ads
-        ads = await ad_generator.generate_ads(group_name, group_keywords, count=1)
-        
-        campaign_data.append({
-            "group_name": group_name,
-            "keywords": group_keywords,
-            "ads": ads
-        })
+    # 3. Generate Ads for new or materially changed groups only
+    groups = [(group_name_for(cluster_id, clusters[cluster_id]), clusters[cluster_id]) for cluster_id in stale]
+
+    last_update = 0.0
+    progress = {"done": 0, "total": len(groups)}
+    preview = {} # group index -> its first finished ad, in order of arrival
+
+    async def refresh_status(force: bool = False):
+        # Telegram rate-limits message edits, so refresh at most every couple of seconds
+        nonlocal last_update
+        now = time.monotonic()
+        if not force and now - last_update < 2:
+            return
+        last_update = now
+        lines = [f"✍️ Пишу объявления: {progress['done']}/{progress['total']}..."]
+        if preview:
+            lines.append("\nУже готово:")
+            for index, ad in list(preview.items())[:PREVIEW_GROUPS]:
+                lines.append(f"• {groups[index][0]}\n   {ad.get('headline_1', '')}\n   {ad.get('text', '')}")
+        try:
+            await status_msg.edit_text("\n".join(lines))
+        except Exception:
+            pass # Ignore "message is not modified"
+
+    async def report_progress(done: int, total: int):
+        progress["done"] = done
+        await refresh_status(force=done == total)
+
+    async def show_ad(index: int, ad: dict):
+        # Ads stream in as they are written: show the first finished groups right away
+        if index in preview:
+            return
+        preview[index] = ad
+        if len(preview) <= PREVIEW_GROUPS:
+            await refresh_status(force=len(preview) == 1)
+
+    all_ads = await ad_generator.generate_ads_batch(groups, count=1, on_progress=report_progress, on_ad=show_ad)
+
+    for cluster_id, ads in zip(stale, all_ads):
+        if ads: # Failed groups stay stale and are retried on the next update
+            project["ads"][cluster_id] = ads
+            project["ads_size"][cluster_id] = len(clusters[cluster_id])
+    await asyncio.to_thread(project_store.save_state, project_id, project)
+    await state.update_data(last_project=project_id, last_seed=seed_word)
+
+    def build_campaign() -> Campaign:
+        campaign = Campaign(f"Campaign_{seed_word}")
+        for cluster_id, group_keywords in clusters.items():
+            # Exporters still get every original phrase
+            keywords = []
+            for phrase in group_keywords:
+                keywords.extend(project["members"].get(phrase, [phrase]))
+            campaign.add_group(group_name_for(cluster_id, group_keywords), keywords,
+                               project["ads"].get(cluster_id, []), shows=project["shows"])
+        return campaign
+
+    campaign = await asyncio.to_thread(build_campaign)
 
     await status_msg.edit_text("✅ Объявления готовы.\n📊 Генерирую Excel файл и Google Таблицу...")
     
     # 4. Export to Excel & Google Sheets
-    file_path = None
+    export = None
     sheet_url = None
     
     try:
-        file_path = excel_service.create_campaign_file(f"Campaign_{seed_word}", campaign_data)
+        export = await excel_service.create_campaign_file_async(campaign)
     except Exception as e:
         logger.error(f"Excel export error: {e}")
         
     try:
-        sheet_url = await sheets_service.create_report_sheet(message.from_user.id, seed_word, campaign_data)
+        sheet_url = await sheets_writer.write_report(message.from_user.id, seed_word, campaign)
     except Exception as e:
         logger.error(f"Sheets export error: {e}")
 
-    if file_path or sheet_url:
+    if export or sheet_url:
         await status_msg.delete()
         
         caption = "🎉 Ваша рекламная кампания готова!"
         if sheet_url:
             caption += f"\n\n🔗 [Google Таблица под Direct Commander]({sheet_url})"
             
-        if file_path:
-            await message.answer_document(
-                types.FSInputFile(file_path),
-                caption=caption,
-                parse_mode="Markdown"
-            )
+        if export:
+            # Uploaded straight from memory; only oversized exports come from a per-job file
+            document = types.BufferedInputFile(export.data, filename=export.filename) if export.data is not None \
+                else types.FSInputFile(export.path, filename=export.filename)
+            try:
+                await message.answer_document(
+                    document,
+                    caption=caption,
+                    parse_mode="Markdown"
+                )
+            finally:
+                export.discard()
         elif sheet_url:
              await message.answer(caption, parse_mode="Markdown")
     else:
@@ -182,7 +301,7 @@ async def process_url(message: types.Message, state: FSMContext):
         await state.set_state(BotStates.waiting_for_manual_content)
         return
         
-    await process_site_text(message, state, status_msg, site_text)
+    await process_site_text(message, state, status_msg, site_text, url=url)
 
 @router.message(BotStates.waiting_for_manual_content)
 async def process_manual_content_handler(message: types.Message, state: FSMContext):
@@ -194,14 +313,21 @@ async def process_manual_content_handler(message: types.Message, state: FSMConte
     status_msg = await message.answer("✅ Текст получен!\n🧠 Анализирую контент...")
     await process_site_text(message, state, status_msg, text)
 
-async def process_site_text(message: types.Message, state: FSMContext, status_msg: types.Message, site_text: str):
+async def process_site_text(message: types.Message, state: FSMContext, status_msg: types.Message, site_text: str,
+                            url: str = None):
     await state.update_data(site_context=site_text)
     
     if "анализирую" not in status_msg.text.lower():
         await status_msg.edit_text("🧠 Анализирую контент и подбираю ключевые слова...")
     
-    # 2. Generate Seeds
-    seeds = await openai_service.generate_seed_keywords(site_text)
+    # 2. Generate Seeds (skipped when the page is unchanged since the last analysis)
+    seeds = await asyncio.to_thread(url_cache.get_seeds, url, site_text) if url else None
+    if seeds:
+        logger.info(f"Reusing {len(seeds)} cached seeds for {url}")
+    else:
+        seeds = await openai_service.generate_seed_keywords(site_text)
+        if url:
+            await asyncio.to_thread(url_cache.put_seeds, url, site_text, seeds)
     
     if not seeds:
         await status_msg.edit_text("❌ Не удалось сгенерировать ключевые слова.")
@@ -5,5 +5,6 @@ def get_main_kb():
     builder.button(text="Собрать семантику")
     builder.button(text="Генерация из списка")
     builder.button(text="Анализ сайта")
+    builder.button(text="Дополнить кампанию")
     builder.adjust(1)
     return builder.as_markup(resize_keyboard=True)
@@ -5,4 +5,5 @@ class BotStates(StatesGroup):
     waiting_for_list = State()
     waiting_for_url = State()
     waiting_for_manual_content = State()
+    waiting_for_additions = State()
     processing = State()
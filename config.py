@@ -13,14 +13,98 @@ class Config:
     YANDEX_CLIENT_ID = os.getenv("YANDEX_CLIENT_ID")
     YANDEX_LOGIN = os.getenv("YANDEX_LOGIN")
     YANDEX_PASSWORD = os.getenv("YANDEX_PASSWORD")
+    YANDEX_POOL_SIZE = int(os.getenv("YANDEX_POOL_SIZE", "10"))  # Max open connections to the Direct API
+    YANDEX_KEEPALIVE = float(os.getenv("YANDEX_KEEPALIVE", "60"))  # Seconds an idle connection stays open
+    YANDEX_CONNECT_TIMEOUT = float(os.getenv("YANDEX_CONNECT_TIMEOUT", "10"))
+    YANDEX_REQUEST_TIMEOUT = float(os.getenv("YANDEX_REQUEST_TIMEOUT", "60"))
+    WORDSTAT_MAX_REPORTS = int(os.getenv("WORDSTAT_MAX_REPORTS", "5"))  # Concurrent reports allowed on the account
+    WORDSTAT_MAX_PHRASES = int(os.getenv("WORDSTAT_MAX_PHRASES", "10"))  # Phrases per report
+    WORDSTAT_POLL_MIN = float(os.getenv("WORDSTAT_POLL_MIN", "2"))  # Report list poll interval, grows up to the max
+    WORDSTAT_POLL_MAX = float(os.getenv("WORDSTAT_POLL_MAX", "15"))
+    WORDSTAT_REPORT_TIMEOUT = float(os.getenv("WORDSTAT_REPORT_TIMEOUT", "180"))
+    WORDSTAT_CACHE_TTL = float(os.getenv("WORDSTAT_CACHE_TTL", str(7 * 24 * 3600)))  # Seconds
+    WORDSTAT_CACHE_MAX_ENTRIES = int(os.getenv("WORDSTAT_CACHE_MAX_ENTRIES", "5000"))
+    WORDSTAT_CACHE_MAX_MB = int(os.getenv("WORDSTAT_CACHE_MAX_MB", "200"))
     
     # OpenAI
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    LLM_RPM = int(os.getenv("LLM_RPM", "500"))  # Account limits, shared by every call site
+    LLM_TPM = int(os.getenv("LLM_TPM", "200000"))
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))  # Requests in flight, process-wide
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))  # On 429 / timeouts / 5xx
+    LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))  # Seconds, doubled per retry, jittered
+    LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+    LLM_COMPLETION_TOKENS = int(os.getenv("LLM_COMPLETION_TOKENS", "600"))  # Completion estimate when max_tokens is unset
+    LLM_DEADLINE_SEEDS = float(os.getenv("LLM_DEADLINE_SEEDS", "30"))  # Seconds per call, end to end
+    LLM_DEADLINE_CLUSTERS = float(os.getenv("LLM_DEADLINE_CLUSTERS", "120"))
+    LLM_DEADLINE_ADS = float(os.getenv("LLM_DEADLINE_ADS", "60"))
+    LLM_DEADLINE_ADS_PACKED = float(os.getenv("LLM_DEADLINE_ADS_PACKED", "120"))
+    LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"  # Duplicate calls slower than p95
+    LLM_HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1"))  # Hedges per call, at most
+    LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))  # Latencies needed before hedging a site
+    AD_GEN_CONCURRENCY = int(os.getenv("AD_GEN_CONCURRENCY", "8"))  # Parallel ad-generation requests per pipeline
+    AD_PACK_ENABLED = os.getenv("AD_PACK_ENABLED", "false").lower() == "true"  # Several clusters per ad request
+    AD_PACK_TOKENS = int(os.getenv("AD_PACK_TOKENS", "1500"))  # Cluster-description tokens per packed request
+    AD_PACK_MAX_CLUSTERS = int(os.getenv("AD_PACK_MAX_CLUSTERS", "8"))
+    AD_REPAIR_ATTEMPTS = int(os.getenv("AD_REPAIR_ATTEMPTS", "2"))  # Repair requests per ad before trimming locally
+    LLM_CLUSTER_CHUNK_TOKENS = int(os.getenv("LLM_CLUSTER_CHUNK_TOKENS", "1500"))  # Keyword tokens per LLM clustering request
+    LLM_CLUSTER_CONCURRENCY = int(os.getenv("LLM_CLUSTER_CONCURRENCY", "8"))
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+    LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "500"))
+    LLM_CACHE_TTL_ADS = float(os.getenv("LLM_CACHE_TTL_ADS", str(3 * 24 * 3600)))  # Seconds, per call site
+    LLM_CACHE_TTL_CLUSTERS = float(os.getenv("LLM_CACHE_TTL_CLUSTERS", str(7 * 24 * 3600)))
+    LLM_CACHE_TTL_SEEDS = float(os.getenv("LLM_CACHE_TTL_SEEDS", str(24 * 3600)))
     
+    # Clustering
+    DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"  # Collapse near-duplicate phrases first
+    DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))  # Min Jaccard similarity of normalised token sets
+    DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "64"))  # MinHash permutations
+    DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "16"))  # LSH bands
+    CLUSTER_WORKERS = int(os.getenv("CLUSTER_WORKERS", "2"))  # Clustering jobs running at once (one process each)
+    CLUSTER_TIMEOUT = float(os.getenv("CLUSTER_TIMEOUT", "300"))  # Seconds per clustering job
+    CLUSTER_LARGE_THRESHOLD = int(os.getenv("CLUSTER_LARGE_THRESHOLD", "50000"))  # Switch to streaming mode at this size
+    CLUSTER_CHUNK_SIZE = int(os.getenv("CLUSTER_CHUNK_SIZE", "10000"))
+    CLUSTER_SVD_SAMPLE = int(os.getenv("CLUSTER_SVD_SAMPLE", "10000"))
+    CLUSTER_SVD_COMPONENTS = int(os.getenv("CLUSTER_SVD_COMPONENTS", "100"))
+    CLUSTER_BACKEND = os.getenv("CLUSTER_BACKEND", "tfidf")  # "tfidf" or "embedding"
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "hash")  # "hash" (local, deterministic) or "openai"
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+    EMBEDDING_HASH_DIM = int(os.getenv("EMBEDDING_HASH_DIM", "256"))
+    CLUSTER_CHANGE_RATIO = float(os.getenv("CLUSTER_CHANGE_RATIO", "0.2"))  # Regenerate a group's ads once it grows by this share
+
+    # Site parsing: plain HTTP first, headless Chrome pool as fallback
+    HTTP_FETCH_TIMEOUT = float(os.getenv("HTTP_FETCH_TIMEOUT", "6"))
+    HTTP_FETCH_MAX_BYTES = int(os.getenv("HTTP_FETCH_MAX_BYTES", str(2 * 1024 * 1024)))
+    PARSER_MIN_TEXT_CHARS = int(os.getenv("PARSER_MIN_TEXT_CHARS", "200"))  # Shorter text escalates to the browser
+    BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))  # Warm drivers / parallel page loads
+    BROWSER_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", "50"))  # Recycle a driver after this many pages
+    BROWSER_MAX_WAITING = int(os.getenv("BROWSER_MAX_WAITING", "10"))  # Queued page loads before rejecting
+    BROWSER_PAGE_TIMEOUT = float(os.getenv("BROWSER_PAGE_TIMEOUT", "30"))
+    BROWSER_SETTLE_TIMEOUT = float(os.getenv("BROWSER_SETTLE_TIMEOUT", "8"))  # Max wait for the DOM to settle
+
+    # Local caches
+    CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+    URL_CACHE_MAX_ENTRIES = int(os.getenv("URL_CACHE_MAX_ENTRIES", "5000"))
+    URL_CACHE_RETENTION = float(os.getenv("URL_CACHE_RETENTION", str(30 * 24 * 3600)))  # Keep entries for revalidation
+    URL_CACHE_HTTP_TTL = float(os.getenv("URL_CACHE_HTTP_TTL", "3600"))  # HTTP pages without ETag/Last-Modified
+    URL_CACHE_BROWSER_TTL = float(os.getenv("URL_CACHE_BROWSER_TTL", str(24 * 3600)))  # Browser-rendered pages
+
+    # Excel export
+    EXPORT_SPILL_MB = float(os.getenv("EXPORT_SPILL_MB", "20"))  # Larger workbooks are built on disk instead of in memory
+    EXPORT_FILE_TTL = float(os.getenv("EXPORT_FILE_TTL", str(6 * 3600)))  # Files in output/ older than this are deleted
+
     # Google
     GOOGLE_CREDENTIALS_FILE = os.getenv("GOOGLE_CREDENTIALS_FILE", "google_secret.json")
     GOOGLE_FOLDER_ID = os.getenv("GOOGLE_FOLDER_ID")
     GOOGLE_MASTER_SHEET_ID = os.getenv("GOOGLE_MASTER_SHEET_ID")
+    SHEETS_CHUNK_ROWS = int(os.getenv("SHEETS_CHUNK_ROWS", "5000"))  # Rows per values write request
+    SHEETS_WRITER_ENABLED = os.getenv("SHEETS_WRITER_ENABLED", "true").lower() == "true"  # Queue master-sheet writes
+    SHEETS_WRITE_RPM = float(os.getenv("SHEETS_WRITE_RPM", "60"))  # Google's per-user write quota
+    SHEETS_BATCH_TABS = int(os.getenv("SHEETS_BATCH_TABS", "20"))  # New tabs per batch_update
+    SHEETS_FLUSH_DELAY = float(os.getenv("SHEETS_FLUSH_DELAY", "0.2"))  # Wait for more reports before a flush
+    SHEETS_MAX_RETRIES = int(os.getenv("SHEETS_MAX_RETRIES", "5"))
+    SHEETS_BACKOFF_BASE = float(os.getenv("SHEETS_BACKOFF_BASE", "1"))
+    SHEETS_BACKOFF_MAX = float(os.getenv("SHEETS_BACKOFF_MAX", "64"))
     
     @classmethod
     def check_deps(cls):
@@ -28,6 +28,27 @@ async def main():
     from bot.handlers import register_routes
     register_routes(dp)
 
+    # Shared service resources live for the whole polling session
+    from services.yandex_api import yandex_service
+    from services.parser_service import parser_service
+    from services.clustering_service import clustering_service
+    from services.llm_gateway import llm_gateway
+    from services.sheets_writer import sheets_writer
+
+    async def on_startup():
+        await yandex_service.start()
+        await parser_service.start()
+
+    async def on_shutdown():
+        await yandex_service.close()
+        await parser_service.close()
+        clustering_service.shutdown()
+        await llm_gateway.close()
+        await sheets_writer.close()
+
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+
     try:
         # await bot.delete_webhook(drop_pending_updates=True) # Commented out to debug
         await bot.delete_webhook(drop_pending_updates=False) 
@@ -1,13 +1,18 @@
-from openai import AsyncOpenAI
 from config import config
+from services.llm_gateway import llm_gateway, LLMGateway, Priority
+from services.ad_validator import ad_validator, AdValidator
 from utils.logger import get_logger
+from utils.json_stream import JsonStreamParser
+from utils.tokens import estimate_tokens
+import asyncio
 import json
 
 logger = get_logger("ad_generator")
 
 class AdGenerator:
-    def __init__(self):
-        self.client = AsyncOpenAI(api_key=config.OPENAI_API_KEY)
+    def __init__(self, gateway: LLMGateway = None, validator: AdValidator = None):
+        self.gateway = gateway or llm_gateway
+        self.validator = validator or ad_validator
         self.marketer_persona = """
         You are a Senior Internet Marketer with 10 years of experience in Yandex Direct.
         Your goal is to create high-converting ad copies (RSYA/Search) based on keyword clusters.
@@ -20,9 +25,43 @@ class AdGenerator:
         Tone: Professional, persuasive, action-oriented.
         """
 
-    async def generate_ads(self, cluster_name: str, keywords: list[str], count: int = 1) -> list[dict]:
+    async def _complete(self, depth: int, on_object=None, **request) -> str:
+        """
+        Runs the request through the gateway. With on_object the completion is streamed and
+        on_object(path, obj) is scheduled for every ad-shaped object at `depth` the moment it
+        closes (see JsonStreamParser); those tasks finish before this returns.
+        """
+        if on_object is None:
+            return await self.gateway.complete(**request)
+
+        parser = JsonStreamParser(depth)
+        tasks = []
+
+        def on_delta(text: str):
+            # Runs inside the stream: only schedule, repairs need gateway slots of their own
+            for path, obj in parser.feed(text):
+                if self._is_valid_ads([obj]):
+                    tasks.append(asyncio.create_task(on_object(path, obj)))
+
+        try:
+            return await self.gateway.complete(on_delta=on_delta, **request)
+        finally:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    @staticmethod
+    async def _emit(callback, *args):
+        try:
+            await callback(*args)
+        except Exception as e:
+            logger.warning(f"Ad callback failed: {e}")
+
+    async def generate_ads(self, cluster_name: str, keywords: list[str], count: int = 1,
+                           use_cache: bool = True, on_ad=None) -> list[dict]:
         """
         Generates ad copies for a given cluster of keywords.
+        use_cache=False forces a fresh generation (e.g. the user asked for new variants).
+        on_ad: optional coroutine function (ad); the response is then streamed and every
+        ad is validated and passed on as soon as it is complete.
         """
         if not keywords:
             return []
@@ -47,9 +86,23 @@ class AdGenerator:
         }}
         """
 
+        streamed = {}
+
+        async def on_object(path: tuple, ad: dict):
+            if path[0] != "ads":
+                return
+            streamed[path[1]] = ad = await self.validator.fix_ad(ad, cluster_name)
+            await self._emit(on_ad, ad)
+
         try:
             logger.info(f"Generating ads for cluster: {cluster_name}")
-            response = await self.client.chat.completions.create(
+            content = await self._complete(
+                2, on_object if on_ad else None,
+                ttl=config.LLM_CACHE_TTL_ADS,
+                priority=Priority.BULK,
+                site="ads",
+                deadline=config.LLM_DEADLINE_ADS,
+                use_cache=use_cache,
                 model="gpt-4o",
                 messages=[
                     {"role": "system", "content": self.marketer_persona},
@@ -58,23 +111,216 @@ class AdGenerator:
                 response_format={"type": "json_object"}
             )
             
-            content = response.choices[0].message.content
             if not content:
                 logger.error("Empty content from LLM")
-                return []
+                return self._streamed_only(streamed, cluster_name)
 
             data = json.loads(content)
             
             # Expecting {"ads":List}
             if isinstance(data, dict) and "ads" in data and isinstance(data["ads"], list):
-                return data["ads"]
+                # Over-limit fields are repaired one by one, not by regenerating the ad
+                return await self._merge_streamed(streamed, data["ads"], cluster_name)
             
             # Fallback if specific key missing but it is a dict
             logger.warning(f"Unexpected JSON structure: {data.keys()}")
-            return []
+            return self._streamed_only(streamed, cluster_name)
 
         except Exception as e:
             logger.error(f"Ad generation error: {e}")
+            return self._streamed_only(streamed, cluster_name)
+
+    @staticmethod
+    def _streamed_only(streamed: dict[int, dict], context: str) -> list[dict]:
+        """
+        What is left of a failed response: the ads that streamed (and were shown) before it broke.
+        """
+        if streamed:
+            logger.warning(f"Keeping {len(streamed)} ads streamed for {context} before the response failed")
+        return [streamed[i] for i in sorted(streamed)]
+
+    async def _merge_streamed(self, streamed: dict[int, dict], ads: list, context: str) -> list[dict]:
+        """
+        Final ad list for one cluster: ads already validated while streaming are reused,
+        only the positions that did not stream are validated now (so nothing is repaired twice).
+        """
+        missing = [i for i in range(len(ads)) if i not in streamed]
+        fixed = dict(zip(missing, await self.validator.fix_ads([ads[i] for i in missing], context)))
+        return [streamed[i] if i in streamed else fixed[i] for i in range(len(ads))]
+
+    @staticmethod
+    def _is_valid_ads(ads) -> bool:
+        return isinstance(ads, list) and bool(ads) and all(
+            isinstance(ad, dict) and isinstance(ad.get("headline_1"), str) and isinstance(ad.get("text"), str)
+            for ad in ads
+        )
+
+    @staticmethod
+    def _cluster_block(cluster_id: int, cluster_name: str, keywords: list[str]) -> str:
+        return f"- id {cluster_id}: theme \"{cluster_name}\"; keywords: {', '.join(keywords[:20])}"
+
+    def make_packs(self, groups: list[tuple[str, list[str]]], budget: int = None,
+                   max_clusters: int = None) -> list[list[int]]:
+        """
+        Splits group indices into packs whose cluster descriptions fit the token budget.
+        """
+        budget = budget or config.AD_PACK_TOKENS
+        max_clusters = max(1, max_clusters or config.AD_PACK_MAX_CLUSTERS)
+        packs, current, used = [], [], 0
+        for index, (cluster_name, keywords) in enumerate(groups):
+            cost = estimate_tokens(self._cluster_block(index, cluster_name, keywords))
+            if current and (used + cost > budget or len(current) >= max_clusters):
+                packs.append(current)
+                current, used = [], 0
+            current.append(index)
+            used += cost
+        if current:
+            packs.append(current)
+        return packs
+
+    async def generate_ads_packed(self, groups: list[tuple[str, list[str]]], indices: list[int],
+                                  count: int = 1, use_cache: bool = True, on_ad=None) -> dict[int, list[dict]]:
+        """
+        Generates ads for several clusters in one request (the persona is sent once).
+        Returns {cluster index: ads} for the clusters that came back well-formed;
+        missing or malformed clusters are simply absent so the caller can retry them alone,
+        unless some of their ads already streamed: those are kept.
+        on_ad: optional coroutine function (cluster index, ad), called as ads stream in.
+        """
+        blocks = "\n".join(self._cluster_block(i, *groups[i]) for i in indices)
+        prompt = f"""
+        Context: Creating Yandex Direct ads for several keyword clusters at once:
+        {blocks}
+        
+        Task: For EVERY cluster write {count} distinct ad variations matching that cluster's theme.
+        
+        Output JSON format (MUST be a JSON object with key "clusters", keyed by cluster id):
+        {{
+            "clusters": {{
+                "<id>": [
+                    {{
+                        "headline_1": "...",
+                        "headline_2": "...",
+                        "text": "...",
+                        "path": "..."
+                    }}
+                ]
+            }}
+        }}
+        """
+
+        streamed = {}
+
+        async def on_object(path: tuple, ad: dict):
+            index = int(path[1]) if str(path[1]).isdigit() else None
+            if path[0] != "clusters" or index not in indices:
+                return
+            ad = await self.validator.fix_ad(ad, groups[index][0])
+            streamed.setdefault(index, {})[path[2]] = ad
+            await self._emit(on_ad, index, ad)
+
+        try:
+            logger.info(f"Generating ads for a pack of {len(indices)} clusters")
+            content = await self._complete(
+                3, on_object if on_ad else None,
+                ttl=config.LLM_CACHE_TTL_ADS,
+                priority=Priority.BULK,
+                site="ads_packed",
+                deadline=config.LLM_DEADLINE_ADS_PACKED,
+                use_cache=use_cache,
+                model="gpt-4o",
+                messages=[
+                    {"role": "system", "content": self.marketer_persona},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format={"type": "json_object"}
+            )
+            data = json.loads(content or "")
+            clusters = data.get("clusters") if isinstance(data, dict) else None
+            if not isinstance(clusters, dict):
+                logger.warning("Packed response without a \"clusters\" object")
+                clusters = {}
+        except Exception as e:
+            logger.error(f"Packed ad generation error: {e}")
+            clusters = {}
+
+        valid = [i for i in indices if self._is_valid_ads(clusters.get(str(i)))]
+        merged = await asyncio.gather(*(
+            self._merge_streamed(streamed.get(i, {}), clusters[str(i)], groups[i][0]) for i in valid
+        ))
+        result = dict(zip(valid, merged))
+        # Clusters the response lost still keep the ads that streamed (and were shown) for them
+        for i in indices:
+            if i not in result and streamed.get(i):
+                result[i] = self._streamed_only(streamed[i], groups[i][0])
+        return result
+
+    async def generate_ads_batch(self, groups: list[tuple[str, list[str]]], count: int = 1,
+                                 concurrency: int = None, on_progress=None,
+                                 use_cache: bool = True, packed: bool = None, on_ad=None) -> list[list[dict]]:
+        """
+        Generates ads for many clusters concurrently.
+        groups: list of (cluster_name, keywords). Results keep the order of `groups`;
+        a cluster that fails gets an empty list instead of aborting the batch.
+        on_progress: optional coroutine function (done, total), awaited as each cluster finishes.
+        on_ad: optional coroutine function (group index, ad); responses are then streamed and
+        each ad is delivered as soon as it is complete and validated.
+        packed (default AD_PACK_ENABLED): send token-budgeted packs of clusters per request;
+        clusters missing from a pack's response are retried one by one.
+        """
+        if not groups:
             return []
 
+        if packed is None:
+            packed = config.AD_PACK_ENABLED
+        limit = max(1, concurrency or config.AD_GEN_CONCURRENCY)
+        semaphore = asyncio.Semaphore(limit)
+        results = [[] for _ in groups]
+        total = len(groups)
+        done = 0
+
+        async def report(finished: int):
+            nonlocal done
+            done += finished
+            if on_progress:
+                try:
+                    await on_progress(done, total)
+                except Exception as e:
+                    logger.warning(f"Progress callback failed: {e}")
+
+        async def worker(index: int, cluster_name: str, keywords: list[str]):
+            async with semaphore:
+                try:
+                    results[index] = await self.generate_ads(
+                        cluster_name, keywords, count=count, use_cache=use_cache,
+                        on_ad=(lambda ad: on_ad(index, ad)) if on_ad else None
+                    )
+                except Exception as e:
+                    logger.error(f"Ad generation failed for {cluster_name}: {e}")
+            await report(1)
+
+        async def pack_worker(indices: list[int]):
+            async with semaphore:
+                packed_ads = await self.generate_ads_packed(groups, indices, count=count, use_cache=use_cache,
+                                                            on_ad=on_ad)
+            for index, ads in packed_ads.items():
+                results[index] = ads
+            await report(len(packed_ads))
+
+            retry = [i for i in indices if i not in packed_ads]
+            if retry:
+                logger.warning(f"Retrying {len(retry)} of {len(indices)} packed clusters one by one")
+                await asyncio.gather(*(worker(i, *groups[i]) for i in retry))
+
+        if packed and total > 1:
+            packs = self.make_packs(groups)
+            logger.info(f"Generating ads for {total} clusters in {len(packs)} packs (concurrency={limit})")
+            await asyncio.gather(*(pack_worker(indices) for indices in packs))
+        else:
+            logger.info(f"Generating ads for {total} clusters (concurrency={limit})")
+            await asyncio.gather(*(worker(i, name, kws) for i, (name, kws) in enumerate(groups)))
+        logger.info(f"Ad validation: {self.validator.summary()}")
+        logger.info(f"LLM gateway: {self.gateway.summary()}")
+        return results
+
 ad_generator = AdGenerator()
@@ -0,0 +1,214 @@
+import json
+import re
+from dataclasses import dataclass
+from config import config
+from services.llm_gateway import llm_gateway, LLMGateway, Priority
+from utils.logger import get_logger
+
+logger = get_logger("ad_validator")
+
+# Yandex Direct text ad limits, as requested from AdGenerator
+DIRECT_LIMITS = {"headline_1": 56, "headline_2": 30, "text": 81, "path": 20}
+# Older OpenAIService.generate_ads format
+LEGACY_LIMITS = {"title1": 35, "title2": 30, "text": 81}
+PATH_FIELDS = frozenset(["path"])
+
+MAX_WORD_LENGTH = 22
+# Narrow characters do not count towards Direct's length limits (up to this many per field)
+NARROW_CHARS = '.,!:;"'
+NARROW_FREE = 15
+
+FORBIDDEN_TEXT_RE = re.compile(r"[^0-9A-Za-zА-Яа-яЁё \-–—.,!?:;\"«»()/+%№#&'‘’`^\[\]_|]")
+FORBIDDEN_PATH_RE = re.compile(r"[^0-9A-Za-zА-Яа-яЁё\-_/№%#]")
+
+@dataclass
+class Violation:
+    field: str
+    rule: str  # "length", "word" or "chars"
+    detail: str
+    overflow: int = 0
+
+def visible_length(value: str) -> int:
+    narrow = sum(1 for ch in value if ch in NARROW_CHARS)
+    return len(value) - min(narrow, NARROW_FREE)
+
+class AdValidator:
+    """
+    Checks generated ads against Direct's limits locally (length, word length, allowed
+    characters) and repairs only the violating fields: one small request per ad listing
+    each problem with its exact overflow. Fields the model cannot fix within
+    AD_REPAIR_ATTEMPTS are trimmed locally so the export never carries an invalid ad.
+    """
+
+    def __init__(self, limits: dict[str, int] = None, gateway: LLMGateway = None):
+        self.limits = limits or DIRECT_LIMITS
+        self.gateway = gateway or llm_gateway
+        self.field_stats = {
+            field: {"checked": 0, "violations": 0, "repaired": 0, "trimmed": 0}
+            for field in self.limits
+        }
+
+    def check_field(self, field: str, value: str) -> list[Violation]:
+        limit = self.limits[field]
+        violations = []
+        is_path = field in PATH_FIELDS
+
+        length = len(value) if is_path else visible_length(value)
+        if length > limit:
+            violations.append(Violation(field, "length", f"{length} chars, limit {limit} (over by {length - limit})",
+                                        length - limit))
+
+        forbidden = sorted(set((FORBIDDEN_PATH_RE if is_path else FORBIDDEN_TEXT_RE).findall(value)))
+        if forbidden:
+            violations.append(Violation(field, "chars", f"characters not allowed: {' '.join(repr(ch) for ch in forbidden)}"))
+
+        if not is_path:
+            for word in value.split():
+                if len(word) > MAX_WORD_LENGTH:
+                    violations.append(Violation(field, "word", f"word \"{word}\" is {len(word)} chars, max {MAX_WORD_LENGTH}",
+                                                len(word) - MAX_WORD_LENGTH))
+        return violations
+
+    def validate(self, ad: dict) -> dict[str, list[Violation]]:
+        """
+        Returns violations per field; fields that pass are absent.
+        """
+        problems = {}
+        for field in self.limits:
+            value = ad.get(field)
+            if not isinstance(value, str):
+                continue
+            violations = self.check_field(field, value)
+            if violations:
+                problems[field] = violations
+        return problems
+
+    def force_fit(self, field: str, value: str) -> str:
+        """
+        Local last resort: drops forbidden characters, cuts long words and trims at a word boundary.
+        """
+        limit = self.limits[field]
+        if field in PATH_FIELDS:
+            return FORBIDDEN_PATH_RE.sub("", re.sub(r"\s+", "-", value.strip()))[:limit]
+
+        value = FORBIDDEN_TEXT_RE.sub("", value)
+        words = [word[:MAX_WORD_LENGTH] for word in value.split()]
+        while words and visible_length(" ".join(words)) > limit:
+            words.pop()
+        fitted = " ".join(words) or value[:limit]
+        return fitted.rstrip(" ,;:-–—")
+
+    def _repairs_all(self, content: str, fields) -> bool:
+        # A repair answer worth caching: every requested field present and within limits
+        try:
+            data = json.loads(content)
+        except ValueError:
+            return False
+        return isinstance(data, dict) and all(
+            isinstance(data.get(field), str) and data[field].strip() and not self.check_field(field, data[field].strip())
+            for field in fields
+        )
+
+    async def _request_repair(self, ad: dict, problems: dict[str, list[Violation]], context: str,
+                              use_cache: bool = True) -> dict:
+        issues = "\n".join(
+            f"- {field} = \"{ad[field]}\": " + "; ".join(v.detail for v in violations)
+            for field, violations in problems.items()
+        )
+        example = ", ".join(f"\"{field}\": \"...\"" for field in problems)
+        prompt = f"""
+        Fix a Yandex Direct ad for the keyword group "{context}".
+        Full ad for context: {json.dumps(ad, ensure_ascii=False)}
+
+        Rewrite ONLY these fields, keeping their meaning, keywords and call to action:
+        {issues}
+
+        Rules: field limits {json.dumps({f: self.limits[f] for f in problems})} chars, words up to {MAX_WORD_LENGTH} chars,
+        letters, digits, spaces and basic punctuation only.
+
+        Output JSON with the fixed fields only: {{ {example} }}
+        """
+        content = await self.gateway.complete(
+            ttl=config.LLM_CACHE_TTL_ADS,
+            priority=Priority.BULK,
+            use_cache=use_cache,
+            # Only repairs that pass validation are cached, so a retry never gets a bad answer back
+            accept=lambda answer: self._repairs_all(answer, problems),
+            site="ad_repair",
+            deadline=config.LLM_DEADLINE_ADS,
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": "You are a PPC copy editor. Output valid JSON only."},
+                {"role": "user", "content": prompt}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.3
+        )
+        data = json.loads(content)
+        return data if isinstance(data, dict) else {}
+
+    async def fix_ad(self, ad: dict, context: str = "") -> dict:
+        """
+        Returns the ad with every checked field within limits.
+        """
+        problems = self.validate(ad)
+        for field in self.limits:
+            if isinstance(ad.get(field), str):
+                self.field_stats[field]["checked"] += 1
+        if not problems:
+            return ad
+
+        for field in problems:
+            self.field_stats[field]["violations"] += 1
+
+        ad = dict(ad)
+        pending = problems
+        for attempt in range(config.AD_REPAIR_ATTEMPTS):
+            try:
+                fixed = await self._request_repair(ad, pending, context, use_cache=attempt == 0)
+            except Exception as e:
+                logger.error(f"Ad repair request failed: {e}")
+                break
+            for field in pending:
+                if isinstance(fixed.get(field), str) and fixed[field].strip():
+                    ad[field] = fixed[field].strip()
+            still = {f: v for f, v in self.validate(ad).items() if f in pending}
+            for field in pending:
+                if field not in still:
+                    self.field_stats[field]["repaired"] += 1
+            pending = still
+            if not pending:
+                return ad
+
+        for field in pending:
+            logger.warning(f"Trimming {field} locally after failed repair: {ad[field]!r}")
+            ad[field] = self.force_fit(field, ad[field])
+            self.field_stats[field]["trimmed"] += 1
+        return ad
+
+    async def fix_ads(self, ads: list[dict], context: str = "") -> list[dict]:
+        return [await self.fix_ad(ad, context) for ad in ads]
+
+    @property
+    def stats(self) -> dict:
+        """
+        Per field: share of checked values that violated a limit, and share of violations
+        the model repaired (the rest were trimmed locally).
+        """
+        report = {}
+        for field, counts in self.field_stats.items():
+            report[field] = dict(
+                counts,
+                violation_rate=counts["violations"] / counts["checked"] if counts["checked"] else 0.0,
+                repair_rate=counts["repaired"] / counts["violations"] if counts["violations"] else 1.0
+            )
+        return report
+
+    def summary(self) -> str:
+        return ", ".join(
+            f"{field}: {s['violations']}/{s['checked']} invalid, {s['repair_rate']:.0%} repaired"
+            for field, s in self.stats.items() if s["checked"]
+        )
+
+ad_validator = AdValidator()
+legacy_ad_validator = AdValidator(limits=LEGACY_LIMITS)
@@ -0,0 +1,180 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+from config import config
+from utils.logger import get_logger
+
+logger = get_logger("browser_pool")
+
+STEALTH_JS = "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
+
+class PoolBusyError(Exception):
+    """Raised when too many page loads are already waiting for a browser."""
+
+def wait_until_settled(driver, timeout: float = None, interval: float = 0.3):
+    """
+    Blocks until the document has loaded and the DOM stops changing
+    (same element count and text length on two consecutive checks), or until timeout.
+    """
+    timeout = timeout if timeout is not None else config.BROWSER_SETTLE_TIMEOUT
+    deadline = time.monotonic() + timeout
+    last = None
+    while time.monotonic() < deadline:
+        state = driver.execute_script(
+            "return [document.readyState,"
+            " document.getElementsByTagName('*').length,"
+            " document.body ? document.body.innerText.length : 0];"
+        )
+        if state[0] == "complete":
+            if state == last:
+                return
+            last = state
+        time.sleep(interval)
+    logger.debug("Page did not settle before timeout, using current DOM")
+
+class BrowserPool:
+    """
+    Pool of pre-launched headless Chrome drivers, used from a dedicated thread pool
+    so page loads never block the event loop. Drivers are recycled after
+    max_pages loads or as soon as one crashes.
+    """
+
+    def __init__(self, options, size: int = None, max_pages: int = None, max_waiting: int = None):
+        self.options = options
+        self.size = size or config.BROWSER_POOL_SIZE
+        self.max_pages = max_pages or config.BROWSER_MAX_PAGES
+        self.max_waiting = max_waiting if max_waiting is not None else config.BROWSER_MAX_WAITING
+
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="browser")
+        self._idle: queue.Queue = queue.Queue()  # (driver, pages_served)
+        self._drivers = set()
+        self._drivers_lock = threading.Lock()
+        self._driver_path: str = None
+        self._slots: asyncio.Semaphore = None
+        self._waiting = 0
+
+    async def start(self):
+        """
+        Resolves the chromedriver binary once and warms up the drivers.
+        """
+        loop = asyncio.get_running_loop()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+
+        if not self._driver_path:
+            self._driver_path = await loop.run_in_executor(self._executor, ChromeDriverManager().install)
+            logger.info(f"Chromedriver resolved: {self._driver_path}")
+
+        launches = [loop.run_in_executor(self._executor, self._launch) for _ in range(self.size - self._idle.qsize())]
+        for result in await asyncio.gather(*launches, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to pre-launch browser: {result}")
+            else:
+                self._idle.put((result, 0))
+        logger.info(f"Browser pool ready: {self._idle.qsize()}/{self.size} warm drivers")
+
+    async def close(self):
+        with self._drivers_lock:
+            drivers = list(self._drivers)
+            self._drivers.clear()
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        self._idle = queue.Queue()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="browser")
+        logger.info("Browser pool closed")
+
+    async def run(self, fn):
+        """
+        Runs fn(driver) on a pooled driver in a worker thread and returns its result.
+        Raises PoolBusyError when max_waiting callers are already queued.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+
+        if self._slots.locked() and self._waiting >= self.max_waiting:
+            raise PoolBusyError(f"{self._waiting} page loads already waiting for a browser")
+
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._run_sync, fn)
+        finally:
+            self._slots.release()
+
+    def _run_sync(self, fn):
+        try:
+            driver, pages = self._idle.get_nowait()
+        except queue.Empty:
+            driver, pages = self._launch(), 0
+
+        try:
+            result = fn(driver)
+        except WebDriverException:
+            # Crashed or wedged browser: replace it rather than reuse it
+            self._retire(driver)
+            self._executor.submit(self._replace)
+            raise
+        except Exception:
+            self._idle.put((driver, pages + 1))
+            raise
+
+        pages += 1
+        if pages >= self.max_pages:
+            logger.info(f"Recycling browser after {pages} pages")
+            self._retire(driver)
+            self._executor.submit(self._replace)
+        else:
+            self._idle.put((driver, pages))
+        return result
+
+    def _launch(self):
+        if not self._driver_path:
+            self._driver_path = ChromeDriverManager().install()
+
+        driver = webdriver.Chrome(service=Service(self._driver_path), options=self.options)
+        # Stealth maneuvering: applies to every page this driver opens
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": STEALTH_JS})
+        driver.set_page_load_timeout(config.BROWSER_PAGE_TIMEOUT)
+        with self._drivers_lock:
+            self._drivers.add(driver)
+        return driver
+
+    def _replace(self):
+        # Keeps the pool warm after a driver has been retired
+        if len(self._drivers) >= self.size:
+            return
+        try:
+            self._idle.put((self._launch(), 0))
+        except Exception as e:
+            logger.error(f"Failed to launch replacement browser: {e}")
+
+    def _retire(self, driver):
+        with self._drivers_lock:
+            self._drivers.discard(driver)
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.debug(f"Driver quit failed: {e}")
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "idle": self._idle.qsize(),
+            "alive": len(self._drivers),
+            "waiting": self._waiting
+        }
@@ -0,0 +1,119 @@
+from array import array
+from dataclasses import dataclass
+
+AD_FIELDS = ("headline_1", "headline_2", "text", "path", "link")
+
+@dataclass(frozen=True)
+class GroupView:
+    group_id: int
+    name: str
+    ad_ids: tuple[int, ...]
+    start: int  # Keyword rows [start, end)
+    end: int
+
+class Campaign:
+    """
+    Compact, columnar campaign shared by all exporters.
+
+    - Groups and ads are interned: each group name is stored once, identical ads
+      (same fields) share one record, and a group refers to its ads by id.
+    - Keywords are rows in columns: all phrases in one newline-separated UTF-8 buffer
+      addressed by an offsets array, Shows in an int64 array. A group's keywords are a contiguous
+      row range, so no per-row group id is stored either.
+
+    Exporters iterate with iter_rows()/keywords() and never see a per-keyword dict.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.group_names: list[str] = []
+        self.group_ads: list[tuple[int, ...]] = []
+        self.group_offsets = array('q', [0])
+        self.ads: list[dict] = []
+        self._ad_ids: dict[tuple, int] = {}
+
+        self._phrases = bytearray()
+        self.phrase_offsets = array('q', [0])
+        self.shows = array('q')
+
+    def __len__(self) -> int:
+        return len(self.shows)
+
+    @property
+    def n_groups(self) -> int:
+        return len(self.group_names)
+
+    def _intern_ad(self, ad: dict) -> int:
+        key = tuple(str(ad.get(field, "") or "") for field in AD_FIELDS)
+        ad_id = self._ad_ids.get(key)
+        if ad_id is None:
+            ad_id = self._ad_ids[key] = len(self.ads)
+            self.ads.append({field: value for field, value in zip(AD_FIELDS, key) if value})
+        return ad_id
+
+    def add_group(self, name: str, keywords: list, ads: list[dict], shows: dict[str, int] = None) -> int:
+        """
+        Appends a group. keywords are phrases or (phrase, shows) pairs; shows maps
+        phrase -> Shows for plain phrases. Returns the group id.
+        """
+        for kw in keywords:
+            if isinstance(kw, (list, tuple)):
+                phrase, count = kw[0], kw[1]
+            else:
+                phrase, count = kw, (shows or {}).get(kw, 0)
+            self._phrases += phrase.replace('\n', ' ').encode('utf-8') + b'\n'
+            self.phrase_offsets.append(len(self._phrases))
+            self.shows.append(int(count or 0))
+
+        self.group_names.append(name)
+        self.group_ads.append(tuple(self._intern_ad(ad) for ad in ads if isinstance(ad, dict)))
+        self.group_offsets.append(len(self.shows))
+        return len(self.group_names) - 1
+
+    def phrase(self, row: int) -> str:
+        return self._phrases[self.phrase_offsets[row]:self.phrase_offsets[row + 1] - 1].decode('utf-8')
+
+    def _group_phrases(self, view: GroupView) -> list[str]:
+        # One decode per group is much cheaper than one per row
+        if view.end == view.start:
+            return []
+        return self._phrases[self.phrase_offsets[view.start]:self.phrase_offsets[view.end] - 1].decode('utf-8').split('\n')
+
+    def group(self, group_id: int) -> GroupView:
+        return GroupView(group_id, self.group_names[group_id], self.group_ads[group_id],
+                         self.group_offsets[group_id], self.group_offsets[group_id + 1])
+
+    def groups(self):
+        for group_id in range(self.n_groups):
+            yield self.group(group_id)
+
+    def keywords(self, group_id: int):
+        """
+        Yields (phrase, shows) for one group.
+        """
+        view = self.group(group_id)
+        yield from zip(self._group_phrases(view), self.shows[view.start:view.end])
+
+    def primary_ad(self, group_id: int) -> dict:
+        ad_ids = self.group_ads[group_id]
+        return self.ads[ad_ids[0]] if ad_ids else None
+
+    def iter_rows(self, require_ad: bool = True):
+        """
+        Yields (group name, phrase, shows, primary ad) per keyword, in group order.
+        The ad dict and group name are shared objects, not per-row copies.
+        require_ad=True skips groups that have no ads.
+        """
+        for view in self.groups():
+            ad = self.primary_ad(view.group_id)
+            if ad is None and require_ad:
+                continue
+            for phrase, shows in zip(self._group_phrases(view), self.shows[view.start:view.end]):
+                yield view.name, phrase, shows, ad or {}
+
+    def memory_bytes(self) -> int:
+        """
+        Approximate size of the columnar buffers (phrases, offsets, Shows).
+        """
+        return (len(self._phrases) + self.phrase_offsets.itemsize * len(self.phrase_offsets)
+                + self.shows.itemsize * len(self.shows) + self.group_offsets.itemsize * len(self.group_offsets))
@@ -1,23 +1,213 @@
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
+import asyncio
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
 from collections import defaultdict
+from config import config
+from services.embedding_service import Embedder, EmbeddingStore, get_embedder
+from services.project_store import project_store
 from utils.logger import get_logger
 
 logger = get_logger("clustering_service")
 
+def _read_keywords(shm_name: str, size: int) -> list[str]:
+    """
+    Keywords arrive as one newline-joined UTF-8 block in shared memory,
+    so large lists are never pickled per job.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # Spawned workers share the parent's resource tracker, which unlinks the segment
+        return bytes(shm.buf[:size]).decode('utf-8').split('\n')
+    finally:
+        shm.close()
+
+_mp_context = multiprocessing.get_context("spawn")
+
+def _job_entry(conn, job, *args):
+    """
+    Body of a job process: runs the job and sends (ok, result or error text) to the parent.
+    """
+    try:
+        conn.send((True, job(*args)))
+    except Exception as e:
+        conn.send((False, f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+def _project_job(shm_name: str, size: int, n_clusters: int, backend: str, project_id: str, rebuild: bool) -> int:
+    """
+    Job process entry point for project clustering. The result is written to the
+    ProjectStore by the worker; only a count travels back.
+    """
+    keywords = _read_keywords(shm_name, size)
+    return ClusteringService(backend=backend).update_project(project_id, keywords, n_clusters, rebuild)
+
+class ClusteringBackend:
+    """
+    Turns keywords into cluster labels. n_clusters is already adjusted to the input size.
+    fit_model also returns a picklable model that assign() uses to place new keywords
+    into the existing clusters (incremental project updates).
+    """
+    name = "base"
+
+    def fit_model(self, keywords: list[str], n_clusters: int, large: bool) -> tuple[list[int], object]:
+        raise NotImplementedError
+
+    def assign(self, model, keywords: list[str]) -> list[int]:
+        raise NotImplementedError
+
+    def fit_labels(self, keywords: list[str], n_clusters: int, large: bool) -> list[int]:
+        labels, _ = self.fit_model(keywords, n_clusters, large)
+        return labels
+
+class TfidfBackend(ClusteringBackend):
+    name = "tfidf"
+
+    def fit_model(self, keywords: list[str], n_clusters: int, large: bool) -> tuple[list[int], dict]:
+        if large:
+            return self._fit_model_large(keywords, n_clusters)
+
+        logger.info(f"Clustering {len(keywords)} keywords into {n_clusters} clusters")
+        
+        # vectorization
+        vectorizer = TfidfVectorizer(max_df=0.8, min_df=0.0, stop_words='english') # 'english' is default, might need russian stop words
+        X = vectorizer.fit_transform(keywords)
+
+        # clustering
+        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+        kmeans.fit(X)
+        
+        return [int(label) for label in kmeans.labels_], {"vectorizer": vectorizer, "svd": None, "kmeans": kmeans}
+
+    def assign(self, model: dict, keywords: list[str]) -> list[int]:
+        X = model["vectorizer"].transform(keywords)
+        if model["svd"] is not None:
+            X = normalize(model["svd"].transform(X))
+        return [int(label) for label in model["kmeans"].predict(X)]
+
+    def _fit_model_large(self, keywords: list[str], n_clusters: int) -> tuple[list[int], dict]:
+        """
+        Streaming mode for 50k+ phrase cores: a stateless hashing vectorizer, LSA
+        (TruncatedSVD) fitted on a sample, and mini-batch k-means fed chunk by chunk.
+        Only one chunk is vectorized at a time, so memory stays bounded and the
+        run time grows linearly with the input.
+        """
+        chunk_size = config.CLUSTER_CHUNK_SIZE
+        logger.info(f"Clustering {len(keywords)} keywords into {n_clusters} clusters (large mode, chunks of {chunk_size})")
+
+        vectorizer = HashingVectorizer(
+            n_features=2 ** 13,  # Sizes the SVD components matrix and its workspace
+            ngram_range=(1, 2),
+            alternate_sign=False,
+            norm='l2'
+        )
+
+        # Reduce dimensions: fit LSA on a random sample instead of the full matrix
+        rng = np.random.default_rng(42)
+        sample_size = min(len(keywords), config.CLUSTER_SVD_SAMPLE)
+        sample_idx = rng.choice(len(keywords), size=sample_size, replace=False)
+        n_components = max(2, min(config.CLUSTER_SVD_COMPONENTS, sample_size - 1))
+        svd = TruncatedSVD(n_components=n_components, random_state=42)
+        svd.fit(vectorizer.transform([keywords[i] for i in sample_idx]))
+
+        def reduced(chunk: list[str]):
+            return normalize(svd.transform(vectorizer.transform(chunk)))
+
+        kmeans = MiniBatchKMeans(
+            n_clusters=n_clusters,
+            random_state=42,
+            batch_size=min(chunk_size, 4096),
+            n_init=3
+        )
+
+        # Pass 1: fit centroids chunk by chunk (partial_fit needs at least n_clusters rows)
+        order = rng.permutation(len(keywords))
+        step = max(chunk_size, n_clusters)
+        for start in range(0, len(order), step):
+            chunk_idx = order[start:start + step]
+            if len(chunk_idx) < n_clusters:
+                break
+            kmeans.partial_fit(reduced([keywords[i] for i in chunk_idx]))
+
+        # Pass 2: assign labels in input order
+        labels = np.empty(len(keywords), dtype=np.int32)
+        for start in range(0, len(keywords), chunk_size):
+            labels[start:start + chunk_size] = kmeans.predict(reduced(keywords[start:start + chunk_size]))
+
+        return labels.tolist(), {"vectorizer": vectorizer, "svd": svd, "kmeans": kmeans}
+
+class EmbeddingBackend(ClusteringBackend):
+    """
+    Clusters phrase embeddings instead of TF-IDF vectors, which groups Russian
+    keywords by meaning rather than by shared surface words. Vectors come from
+    the on-disk EmbeddingStore, so each phrase is embedded only once.
+    """
+    name = "embedding"
+
+    def __init__(self, embedder: Embedder = None, store: EmbeddingStore = None):
+        self.embedder = embedder or get_embedder()
+        self.store = store or EmbeddingStore(self.embedder.name)
+
+    def fit_model(self, keywords: list[str], n_clusters: int, large: bool) -> tuple[list[int], dict]:
+        logger.info(f"Clustering {len(keywords)} keywords into {n_clusters} clusters (embeddings: {self.embedder.name})")
+        X = normalize(self.store.get_or_compute(keywords, self.embedder))
+
+        if large:
+            kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42,
+                                     batch_size=min(config.CLUSTER_CHUNK_SIZE, 4096), n_init=3)
+        else:
+            kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+        return [int(label) for label in kmeans.fit_predict(X)], {"kmeans": kmeans}
+
+    def assign(self, model: dict, keywords: list[str]) -> list[int]:
+        X = normalize(self.store.get_or_compute(keywords, self.embedder))
+        return [int(label) for label in model["kmeans"].predict(X)]
+
+def get_backend(name: str = None) -> ClusteringBackend:
+    name = name or config.CLUSTER_BACKEND
+    if name == "tfidf":
+        return TfidfBackend()
+    if name == "embedding":
+        return EmbeddingBackend()
+    raise ValueError(f"Unknown clustering backend: {name}")
+
 class ClusteringService:
-    def __init__(self, n_clusters=5):
+    def __init__(self, n_clusters=5, backend: ClusteringBackend | str = None):
         self.default_n_clusters = n_clusters
+        self._backend = backend
+        self._slots: asyncio.Semaphore = None
+        self._processes = set()
+
+    @property
+    def backend(self) -> ClusteringBackend:
+        # Resolved lazily: worker processes build their own backend from its name
+        if not isinstance(self._backend, ClusteringBackend):
+            self._backend = get_backend(self._backend)
+        return self._backend
+
+    @property
+    def backend_name(self) -> str:
+        if isinstance(self._backend, ClusteringBackend):
+            return self._backend.name
+        return self._backend or config.CLUSTER_BACKEND
 
     def cluster_keywords(self, keywords: list[str], n_clusters: int = None) -> dict[int, list[str]]:
         """
-        Clusters a list of keywords into groups based on semantic similarity (TF-IDF).
+        Clusters a list of keywords into groups based on semantic similarity
+        (TF-IDF or embeddings, see CLUSTER_BACKEND).
         Returns a dict mapping cluster_id to list of keywords.
+        Runs in the calling thread; the bot clusters through update_project_async.
         """
         if not keywords:
             return {}
-        
+        return self._group(keywords, self.fit_labels(keywords, n_clusters))
+
+    def _resolve_size(self, keywords: list[str], n_clusters: int = None, large: bool = None) -> tuple[int, bool]:
         # If fewer keywords than clusters, adjust
         if n_clusters is None:
             n_clusters = self.default_n_clusters
@@ -25,27 +215,162 @@ class ClusteringService:
         if len(keywords) < n_clusters:
             n_clusters = max(1, len(keywords) // 2)
 
-        try:
-            logger.info(f"Clustering {len(keywords)} keywords into {n_clusters} clusters")
-            
-            # vectorization
-            vectorizer = TfidfVectorizer(max_df=0.8, min_df=0.0, stop_words='english') # 'english' is default, might need russian stop words
-            X = vectorizer.fit_transform(keywords)
+        if large is None:
+            large = len(keywords) >= config.CLUSTER_LARGE_THRESHOLD
+        return n_clusters, large
 
-            # clustering
-            kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-            kmeans.fit(X)
-            
-            # grouping
-            clusters = defaultdict(list)
-            for i, label in enumerate(kmeans.labels_):
-                clusters[int(label)].append(keywords[i])
-                
-            return dict(clusters)
-            
+    def fit_labels(self, keywords: list[str], n_clusters: int = None, large: bool = None) -> list[int]:
+        """
+        Returns the cluster label of every keyword, in input order.
+        Inputs of CLUSTER_LARGE_THRESHOLD keywords or more switch to the bounded-memory
+        streaming mode; `large` forces either mode.
+        """
+        if not keywords:
+            return []
+        labels, _ = self._fit_model(keywords, n_clusters, large)
+        return labels
+
+    def _fit_model(self, keywords: list[str], n_clusters: int = None, large: bool = None) -> tuple[list[int], object]:
+        n_clusters, large = self._resolve_size(keywords, n_clusters, large)
+
+        try:
+            return self.backend.fit_model(keywords, n_clusters, large)
         except Exception as e:
             logger.error(f"Clustering error: {e}")
-            # Fallback: return all in one cluster
-            return {0: keywords}
+            # Fallback: return all in one cluster. There is no model, so the next
+            # project update refits instead of assigning.
+            return [0] * len(keywords), None
+
+    @staticmethod
+    def _carry_ads(state: dict, clusters: dict[int, list[str]]) -> tuple[dict, dict]:
+        """
+        Ads of the old clusters that a refit reproduced with exactly the same keywords,
+        re-keyed to the new cluster ids. Every other cluster is left stale.
+        """
+        old_ids = {frozenset(group): cluster_id for cluster_id, group in state["clusters"].items()}
+        ads, ads_size = {}, {}
+        for cluster_id, group in clusters.items():
+            old_id = old_ids.get(frozenset(group))
+            if old_id is not None and state["ads"].get(old_id):
+                ads[cluster_id] = state["ads"][old_id]
+                ads_size[cluster_id] = state["ads_size"].get(old_id, len(group))
+        return ads, ads_size
+
+    def update_project(self, project_id: str, keywords: list[str], n_clusters: int = None,
+                       rebuild: bool = False) -> int:
+        """
+        Builds or extends a project's persisted clusters (see ProjectStore).
+        With rebuild=True, or for a new project, all keywords are clustered from scratch.
+        Otherwise only keywords the project has not seen (as a keyword or as a collapsed
+        member) are assigned to their nearest
+        existing cluster; the rest of the state is left untouched. Without a usable saved
+        model (missing file, backend changed) the project is refitted on its known keywords
+        plus the new ones, keeping the ads of clusters that come out unchanged.
+        Returns the number of keywords that were clustered or assigned.
+        """
+        state = None if rebuild else project_store.load_state(project_id)
+        model = project_store.load_model(project_id) if state else None
+
+        if state is None:
+            labels, model = self._fit_model(keywords, n_clusters)
+            project_store.save_model(project_id, model)
+            project_store.save_state(project_id, {
+                "backend": self.backend_name,
+                "clusters": self._group(keywords, labels),
+                "members": {},
+                "shows": {},
+                "ads": {},
+                "ads_size": {}
+            })
+            return len(keywords)
+
+        known = {kw for group in state["clusters"].values() for kw in group}
+        # Phrases collapsed into a canonical earlier are already exported through it
+        known.update(kw for group in state["members"].values() for kw in group)
+        new_keywords = list(dict.fromkeys(kw for kw in keywords if kw not in known))
+
+        if model is None or state.get("backend") != self.backend_name:
+            all_keywords = list(dict.fromkeys(kw for group in state["clusters"].values() for kw in group))
+            all_keywords.extend(new_keywords)
+            logger.warning(f"Project {project_id} has no usable model, refitting on {len(all_keywords)} keywords")
+            labels, model = self._fit_model(all_keywords, n_clusters)
+            clusters = self._group(all_keywords, labels)
+            state["ads"], state["ads_size"] = self._carry_ads(state, clusters)
+            state["clusters"] = clusters
+            state["backend"] = self.backend_name
+            project_store.save_model(project_id, model)
+            project_store.save_state(project_id, state)
+            return len(new_keywords)
+
+        if new_keywords:
+            logger.info(f"Assigning {len(new_keywords)} new keywords to project {project_id}")
+            for kw, label in zip(new_keywords, self.backend.assign(model, new_keywords)):
+                state["clusters"].setdefault(int(label), []).append(kw)
+            project_store.save_state(project_id, state)
+        return len(new_keywords)
+
+    @staticmethod
+    def _group(keywords: list[str], labels) -> dict[int, list[str]]:
+        # grouping
+        clusters = defaultdict(list)
+        for i, label in enumerate(labels):
+            clusters[int(label)].append(keywords[i])
+        return dict(clusters)
+
+    async def _run_job(self, job, keywords: list[str], *args, timeout: float = None):
+        """
+        Runs a module-level job function in its own spawned process with the keywords in
+        shared memory; at most CLUSTER_WORKERS jobs run at once.
+        Raises asyncio.TimeoutError after `timeout` seconds (CLUSTER_TIMEOUT by default);
+        on timeout or cancellation only this job's process is terminated.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(config.CLUSTER_WORKERS)
+
+        payload = '\n'.join(kw.replace('\n', ' ') for kw in keywords).encode('utf-8')
+        async with self._slots:
+            shm = shared_memory.SharedMemory(create=True, size=max(1, len(payload)))
+            receiver, sender = _mp_context.Pipe(duplex=False)
+            # spawn: never fork a process that already runs browser and HTTP threads
+            process = _mp_context.Process(target=_job_entry, args=(sender, job, shm.name, len(payload), *args))
+            try:
+                shm.buf[:len(payload)] = payload
+                process.start()
+                sender.close()
+                self._processes.add(process)
+                try:
+                    ok, result = await asyncio.wait_for(asyncio.to_thread(receiver.recv),
+                                                        timeout=timeout or config.CLUSTER_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.CancelledError):
+                    logger.error(f"Clustering job for {len(keywords)} keywords timed out or was cancelled")
+                    process.terminate()
+                    raise
+                except EOFError:
+                    # The exit code is only known once the process has been reaped
+                    await asyncio.to_thread(process.join, 5)
+                    raise RuntimeError(f"Clustering process exited with code {process.exitcode}")
+                if not ok:
+                    raise RuntimeError(f"Clustering job failed: {result}")
+                return result
+            finally:
+                self._processes.discard(process)
+                if process.pid is not None:
+                    await asyncio.to_thread(process.join)
+                shm.close()
+                shm.unlink()
+
+    async def update_project_async(self, project_id: str, keywords: list[str], n_clusters: int = None,
+                                   rebuild: bool = False, timeout: float = None) -> int:
+        """
+        Runs update_project in a job process. Read the result with project_store.load_state.
+        """
+        if not keywords:
+            return 0
+        return await self._run_job(_project_job, keywords, n_clusters or self.default_n_clusters,
+                                   self.backend_name, project_id, rebuild, timeout=timeout)
+
+    def shutdown(self):
+        for process in list(self._processes):
+            process.terminate()
 
 clustering_service = ClusteringService()
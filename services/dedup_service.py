@@ -0,0 +1,132 @@
+import re
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass, field
+import numpy as np
+from config import config
+from utils.logger import get_logger
+
+logger = get_logger("dedup_service")
+
+# Function words that do not change the intent of a search phrase
+STOP_WORDS = frozenset([
+    "в", "во", "на", "и", "для", "с", "со", "по", "к", "ко", "от", "до", "из", "у", "о", "об",
+    "за", "под", "над", "при", "без", "а", "или", "ли", "же", "то", "как", "что", "это"
+])
+# Inflection endings, longest first; a crude stemmer is enough to align singular/plural and cases
+ENDINGS = sorted([
+    "ами", "ями", "ого", "его", "ому", "ему", "ыми", "ими", "иях", "ах", "ях", "ов", "ев", "ей",
+    "ой", "ый", "ий", "ая", "яя", "ое", "ее", "ые", "ие", "ом", "ем", "ам", "ям", "ую", "юю",
+    "а", "я", "о", "е", "ы", "и", "у", "ю", "ь"
+], key=len, reverse=True)
+TOKEN_RE = re.compile(r"[a-zа-я0-9]+")
+MERSENNE_PRIME = (1 << 61) - 1
+
+@dataclass
+class DedupResult:
+    # Canonical phrases with summed Shows, in order of first appearance
+    semantics: list[tuple[str, int]]
+    # canonical phrase -> every original (phrase, shows) it stands for
+    members: dict[str, list[tuple[str, int]]] = field(default_factory=dict)
+
+class DedupService:
+    """
+    Collapses near-duplicate keywords (word order, inflections, stop-word variants)
+    before clustering. Phrases are normalised to stemmed token sets, candidates
+    are found with MinHash/LSH in sub-quadratic time and confirmed with the exact
+    Jaccard similarity of their token sets.
+    """
+
+    def __init__(self, threshold: float = None, num_perm: int = None, bands: int = None):
+        self.threshold = threshold or config.DEDUP_THRESHOLD
+        self.num_perm = num_perm or config.DEDUP_NUM_PERM
+        self.bands = bands or config.DEDUP_BANDS
+        self.rows = max(1, self.num_perm // self.bands)
+
+        rng = np.random.default_rng(1)
+        # 32-bit coefficients: a * crc32 stays below 2^64
+        self._a = rng.integers(1, 1 << 32, size=self.num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=self.num_perm, dtype=np.uint64)
+
+    @staticmethod
+    def _stem(token: str) -> str:
+        if len(token) <= 3 or token.isdigit():
+            return token
+        for ending in ENDINGS:
+            if token.endswith(ending) and len(token) - len(ending) >= 3:
+                return token[:-len(ending)]
+        return token
+
+    def normalize(self, phrase: str) -> frozenset:
+        tokens = TOKEN_RE.findall(phrase.lower().replace('ё', 'е'))
+        stems = frozenset(self._stem(t) for t in tokens if t not in STOP_WORDS)
+        # A phrase made only of stop words keeps its raw tokens
+        return stems or frozenset(tokens)
+
+    def _signature(self, tokens: frozenset) -> np.ndarray:
+        hashes = np.array([zlib.crc32(t.encode('utf-8')) for t in tokens] or [0], dtype=np.uint64)
+        # Universal hashing (a*x + b) mod p over the crc32 of every token
+        permuted = (np.outer(hashes, self._a) % MERSENNE_PRIME + self._b) % MERSENNE_PRIME
+        return permuted.min(axis=0)
+
+    def collapse(self, semantics: list[tuple[str, int]]) -> DedupResult:
+        """
+        semantics: list of (phrase, shows). Returns canonical phrases and their members.
+        """
+        if not semantics:
+            return DedupResult(semantics=[], members={})
+
+        # 1. Exact token-set duplicates collapse without any hashing
+        by_tokens: dict[frozenset, list[int]] = {}
+        for i, (phrase, _) in enumerate(semantics):
+            by_tokens.setdefault(self.normalize(phrase), []).append(i)
+        token_sets = list(by_tokens.keys())
+
+        # 2. MinHash + LSH banding over the distinct token sets
+        parent = list(range(len(token_sets)))
+
+        def find(x: int) -> int:
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        def jaccard(x: frozenset, y: frozenset) -> float:
+            return len(x & y) / len(x | y)
+
+        if len(token_sets) > 1:
+            signatures = np.vstack([self._signature(t) for t in token_sets])
+            for band in range(self.bands):
+                buckets = defaultdict(list)
+                band_rows = signatures[:, band * self.rows:(band + 1) * self.rows]
+                for idx, row in enumerate(band_rows):
+                    buckets[row.tobytes()].append(idx)
+
+                for bucket in buckets.values():
+                    if len(bucket) < 2:
+                        continue
+                    # Confirm candidates exactly; cap comparisons in degenerate buckets
+                    for pos, idx in enumerate(bucket[1:], start=1):
+                        for other in bucket[max(0, pos - 32):pos]:
+                            if find(idx) != find(other) and jaccard(token_sets[idx], token_sets[other]) >= self.threshold:
+                                parent[find(idx)] = find(other)
+
+        # 3. Build groups: canonical = most shown member, Shows summed
+        groups: dict[int, list[int]] = defaultdict(list)
+        for set_idx, tokens in enumerate(token_sets):
+            groups[find(set_idx)].extend(by_tokens[tokens])
+
+        canonical_of = {}
+        members = {}
+        for indices in groups.values():
+            indices.sort()
+            best = max(indices, key=lambda i: (semantics[i][1] or 0, -i))
+            canonical = semantics[best][0]
+            members[canonical] = [semantics[i] for i in indices]
+            canonical_of[indices[0]] = (canonical, sum(semantics[i][1] or 0 for i in indices))
+
+        collapsed = [canonical_of[i] for i in sorted(canonical_of)]
+        logger.info(f"Dedup: {len(semantics)} phrases -> {len(collapsed)} canonical")
+        return DedupResult(semantics=collapsed, members=members)
+
+dedup_service = DedupService()
@@ -0,0 +1,163 @@
+import contextlib
+import os
+import re
+import sqlite3
+import threading
+import zlib
+import numpy as np
+from config import config
+from utils.logger import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking
+    fcntl = None
+
+logger = get_logger("embedding_service")
+
+def normalize_phrase(phrase: str) -> str:
+    phrase = phrase.lower().replace('ё', 'е')
+    return re.sub(r"\s+", " ", phrase).strip()
+
+class Embedder:
+    """
+    Turns phrases into fixed-size float32 vectors.
+    `name` identifies the vector space: stores for different embedders never mix.
+    """
+    name = "base"
+    dim = 0
+
+    def embed(self, phrases: list[str]) -> np.ndarray:
+        raise NotImplementedError
+
+class HashEmbedder(Embedder):
+    """
+    Deterministic local embedder: character 3-grams hashed into `dim` buckets.
+    Needs no network, so it is the default for tests and offline runs.
+    """
+
+    def __init__(self, dim: int = None):
+        self.dim = dim or config.EMBEDDING_HASH_DIM
+        self.name = f"hash{self.dim}"
+
+    def embed(self, phrases: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(phrases), self.dim), dtype=np.float32)
+        for i, phrase in enumerate(phrases):
+            for word in phrase.split():
+                padded = f" {word} "
+                for j in range(len(padded) - 2):
+                    vectors[i, zlib.crc32(padded[j:j + 3].encode('utf-8')) % self.dim] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+class OpenAIEmbedder(Embedder):
+    """
+    OpenAI embeddings API. Synchronous on purpose: it runs inside clustering worker processes.
+    """
+
+    def __init__(self, model: str = None, batch_size: int = 512):
+        from openai import OpenAI
+
+        self.model = model or config.EMBEDDING_MODEL
+        self.name = f"openai-{self.model}"
+        self.batch_size = batch_size
+        self.client = OpenAI(api_key=config.OPENAI_API_KEY)
+        self.dim = 0  # Known after the first response
+
+    def embed(self, phrases: list[str]) -> np.ndarray:
+        chunks = []
+        for start in range(0, len(phrases), self.batch_size):
+            response = self.client.embeddings.create(model=self.model, input=phrases[start:start + self.batch_size])
+            chunks.append(np.array([item.embedding for item in response.data], dtype=np.float32))
+        vectors = np.vstack(chunks)
+        self.dim = vectors.shape[1]
+        return vectors
+
+def get_embedder(name: str = None) -> Embedder:
+    name = name or config.EMBEDDING_BACKEND
+    if name == "openai":
+        return OpenAIEmbedder()
+    if name == "hash":
+        return HashEmbedder()
+    raise ValueError(f"Unknown embedding backend: {name}")
+
+class EmbeddingStore:
+    """
+    Append-only on-disk store of phrase vectors for one embedder.
+    Vectors live in a flat float32 file read through np.memmap; a sqlite index maps
+    each normalized phrase to its row. Every phrase is embedded once, ever; later runs
+    only read rows. Appends take a file lock, so several worker processes can share a store.
+    """
+
+    def __init__(self, namespace: str, root: str = None):
+        self.dir = os.path.join(root or os.path.join(config.CACHE_DIR, "embeddings"), namespace)
+        os.makedirs(self.dir, exist_ok=True)
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        self.lock_path = os.path.join(self.dir, ".lock")
+        self._thread_lock = threading.Lock()
+
+        self._conn = sqlite3.connect(os.path.join(self.dir, "index.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS rows (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+    @property
+    def dim(self) -> int:
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        return int(row[0]) if row else 0
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with self._thread_lock, open(self.lock_path, "a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _lookup(self, keys: list[str]) -> dict[str, int]:
+        found = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            found.update(self._conn.execute(f"SELECT key, row FROM rows WHERE key IN ({placeholders})", batch))
+        return found
+
+    def get_or_compute(self, phrases: list[str], embedder: Embedder) -> np.ndarray:
+        """
+        Returns an (n, dim) float32 matrix for phrases, embedding only the ones never seen before.
+        """
+        keys = [normalize_phrase(p) for p in phrases]
+        unique = list(dict.fromkeys(keys))
+        found = self._lookup(unique)
+        missing = [k for k in unique if k not in found]
+
+        if missing:
+            vectors = np.ascontiguousarray(embedder.embed(missing), dtype=np.float32)
+            with self._locked():
+                # Another process may have stored some of them meanwhile
+                found.update(self._lookup(missing))
+                fresh = [i for i, k in enumerate(missing) if k not in found]
+                if fresh:
+                    dim = self.dim or vectors.shape[1]
+                    if vectors.shape[1] != dim:
+                        raise ValueError(f"Embedding size {vectors.shape[1]} does not match store size {dim}")
+                    start_row = os.path.getsize(self.vectors_path) // (dim * 4) if os.path.exists(self.vectors_path) else 0
+                    with open(self.vectors_path, "ab") as f:
+                        f.write(vectors[fresh].tobytes())
+                    new_rows = {missing[i]: start_row + offset for offset, i in enumerate(fresh)}
+                    self._conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('dim', ?)", (str(dim),))
+                    self._conn.executemany("INSERT INTO rows (key, row) VALUES (?, ?)", new_rows.items())
+                    self._conn.commit()
+                    found.update(new_rows)
+            logger.info(f"Embedded {len(missing)} new phrases, {len(unique) - len(missing)} loaded from store")
+
+        dim = self.dim
+        matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r").reshape(-1, dim)
+        return np.asarray(matrix[[found[k] for k in keys]])
+
+    def close(self):
+        self._conn.close()
@@ -1,98 +1,186 @@
-import pandas as pd
-from utils.logger import get_logger
+import asyncio
+import io
 import os
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from openpyxl import Workbook
+from config import config
+from services.campaign_model import Campaign
+from utils.logger import get_logger
 
 logger = get_logger("excel_service")
 
+# Direct Commander import columns, in file order
+COLUMNS = ["Campaign Name", "Group Name", "Phrase", "Headline 1", "Headline 2", "Text", "Path", "Link"]
+DEFAULT_LINK = "https://example.com" # Placeholder
+
+@dataclass
+class ExcelExport:
+    # Name the user sees; the same for every run of a seed
+    filename: str
+    rows: int
+    # Exactly one is set: the file bytes, or the path of a spilled per-job file
+    data: bytes = None
+    path: str = None
+
+    @property
+    def size(self) -> int:
+        return len(self.data) if self.data is not None else os.path.getsize(self.path)
+
+    def discard(self):
+        """
+        Removes the spilled file once it has been delivered (no-op for in-memory exports).
+        """
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+class SpillBuffer(io.RawIOBase):
+    """
+    Seekable write buffer that lives in memory until it grows past max_bytes, then moves
+    its contents to `path` and continues on disk. Like SpooledTemporaryFile, but the
+    spilled file has a name, so it can be uploaded from disk.
+    """
+
+    def __init__(self, max_bytes: int, path: str):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.file = io.BytesIO()
+        self.spilled = False
+
+    def _rollover(self):
+        position = self.file.tell()
+        disk = open(self.path, "w+b")
+        disk.write(self.file.getbuffer())
+        disk.seek(position)
+        self.file = disk
+        self.spilled = True
+
+    def writable(self): return True
+    def readable(self): return True
+    def seekable(self): return True
+
+    def write(self, b) -> int:
+        if not self.spilled and self.file.tell() + len(b) > self.max_bytes:
+            self._rollover()
+        return self.file.write(b)
+
+    def read(self, size=-1): return self.file.read(size)
+    def seek(self, offset, whence=io.SEEK_SET): return self.file.seek(offset, whence)
+    def tell(self): return self.file.tell()
+    def flush(self): self.file.flush()
+
+    def getvalue(self) -> bytes:
+        return self.file.getvalue()
+
+    def close(self):
+        if not self.closed:
+            super().close()  # Flushes through to self.file first
+            self.file.close()
+
+def safe_filename(name: str) -> str:
+    # Seeds are user input: keep letters, digits, '-', '_' and '.'
+    return re.sub(r"[^\w.-]+", "_", name).strip("._") or "campaign"
+
 class ExcelService:
-    def __init__(self, output_dir="output"):
+    def __init__(self, output_dir="output", spill_bytes: int = None, file_ttl: float = None):
         self.output_dir = output_dir
+        self.spill_bytes = spill_bytes if spill_bytes is not None else int(config.EXPORT_SPILL_MB * 2**20)
+        self.file_ttl = file_ttl if file_ttl is not None else config.EXPORT_FILE_TTL
         os.makedirs(self.output_dir, exist_ok=True)
+        self.cleanup()
 
-    def create_campaign_file(self, campaign_name: str, ad_groups: list[dict]) -> str:
+    def cleanup(self, max_age: float = None) -> int:
+        """
+        Deletes files in output_dir older than max_age seconds (EXPORT_FILE_TTL by default):
+        spilled exports whose upload never finished, and files from earlier versions.
+        Returns the number of files removed.
+        """
+        max_age = self.file_ttl if max_age is None else max_age
+        cutoff = time.time() - max_age
+        removed = 0
+        try:
+            with os.scandir(self.output_dir) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file() and entry.stat().st_mtime < cutoff:
+                            os.remove(entry.path)
+                            removed += 1
+                    except OSError as e:
+                        logger.warning(f"Could not remove old export {entry.path}: {e}")
+        except OSError as e:
+            logger.error(f"Export cleanup failed: {e}")
+        if removed:
+            logger.info(f"Removed {removed} aged export files from {self.output_dir}")
+        return removed
+
+    @staticmethod
+    def iter_rows(campaign: Campaign):
+        """
+        Yields one row tuple (in COLUMNS order) per keyword, straight from the campaign columns.
+
+        Flat format: every keyword of a group gets the group's first ad (MVP).
+        Groups without ads are skipped.
+        """
+        for group_name, phrase, _, ad in campaign.iter_rows():
+            yield (campaign.name, group_name, phrase,
+                   ad.get("headline_1", ""), ad.get("headline_2", ""), ad.get("text", ""),
+                   ad.get("path", ""), ad.get("link", DEFAULT_LINK))
+
+    def create_campaign_file(self, campaign: Campaign) -> ExcelExport:
         """
         Creates an Excel file compatible with Yandex Direct Commander (simplified).
-        
-        structure of ad_groups:
-        [
-            {
-                "group_name": "Cluster Name",
-                "keywords": ["kw1", "kw2"],
-                "ads": [
-                    {"headline_1": "...", "headline_2": "...", "text": "...", "path": "...", "link": "..."}
-                ]
-            }
-        ]
+        Rows are streamed into a write-only workbook, so memory stays flat whatever the
+        campaign size. Blocking: call create_campaign_file_async from handlers.
+
+        The workbook is built in memory and returned as bytes; files larger than
+        EXPORT_SPILL_MB spill to a uniquely named file in output_dir, which the caller
+        discards after upload (leftovers age out via cleanup()).
         """
-        rows = []
-        
-        for group in ad_groups:
-            group_name = group.get("group_name", "Group")
-            
-            # For each ad in the group, we need to cross-product with keywords?
-            # Usually strict structure: 1 row per keyword/ad combo or separate tables.
-            # Yandex Commander Format:
-            # Campaign, Group, Keyword, Headline 1, Headline 2, Text, Link, Path, etc.
-            
-            # Simple Strategy: One generic ad per group applied to all keywords in that group
-            # OR Multiple ads per group.
-            
-            current_ads = group.get("ads", [])
-            current_keywords = group.get("keywords", [])
-            
-            if not current_ads or not current_keywords:
-                continue
-
-            # In Direct Commander, you list keywords and ads belonging to the same group.
-            # They don't strictly need to be on the same row, but traditionally:
-            # Row 1: Group | Keyword 1 | Ad 1
-            # Row 2: Group | Keyword 2 | -
-            # ...
-            # But the most robust way: Create rows for Keywords, and rows for Ads separately within the group logic.
-            # For simplicity here: We will create a "Unified" row if possible, or cartesian product.
-            
-            # Let's do Cartesian product: Every keyword gets every ad (valid for search, maybe not ideal for reach).
-            # ACTUALLY BETTER:
-            # Just create distinct rows.
-            
-            # Let's stick to a flat format:
-            # Column: Group Name
-            # Column: Phrase (Keyword)
-            # Column: Headline 1
-            # Column: Headline 2
-            # Column: Text
-            # Column: Path
-            # Column: Link
-            
-            # We will use the first ad for all keywords for now (MVP).
-            primary_ad = current_ads[0]
-            
-            for kw in current_keywords:
-                row = {
-                    "Campaign Name": campaign_name,
-                    "Group Name": group_name,
-                    "Phrase": kw,
-                    "Headline 1": primary_ad.get("headline_1", ""),
-                    "Headline 2": primary_ad.get("headline_2", ""),
-                    "Text": primary_ad.get("text", ""),
-                    "Path": primary_ad.get("path", ""),
-                    "Link": primary_ad.get("link", "https://example.com") # Placeholder
-                }
-                rows.append(row)
-                
-        if not rows:
-            logger.warning("No data to write to Excel.")
-            return None
-            
-        df = pd.DataFrame(rows)
-        
-        filename = f"{self.output_dir}/{campaign_name.replace(' ', '_')}_campaign.xlsx"
+        filename = f"{safe_filename(campaign.name)}_campaign.xlsx"
+        spill_path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}_{filename}")
+        buffer = SpillBuffer(self.spill_bytes, spill_path)
+        start = time.perf_counter()
         try:
-            df.to_excel(filename, index=False)
-            logger.info(f"Campaign saved to {filename}")
-            return filename
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet("Sheet1")
+            ws.append(COLUMNS)
+
+            rows = 0
+            for row in self.iter_rows(campaign):
+                ws.append(row)
+                rows += 1
+
+            if not rows:
+                logger.warning("No data to write to Excel.")
+                buffer.close()
+                return None
+
+            wb.save(buffer)
+            export = ExcelExport(filename, rows, path=spill_path) if buffer.spilled \
+                else ExcelExport(filename, rows, data=buffer.getvalue())
+            buffer.close()
         except Exception as e:
             logger.error(f"Failed to save Excel: {e}")
+            buffer.close()
+            if buffer.spilled:
+                ExcelExport(filename, 0, path=spill_path).discard()
             return None
 
+        elapsed = time.perf_counter() - start
+        logger.info(f"Campaign {filename} built {'on disk' if export.path else 'in memory'}: {rows} rows, "
+                    f"{export.size / 2**20:.1f} MB in {elapsed:.2f}s ({rows / max(elapsed, 1e-6):.0f} rows/s)")
+        self.cleanup()
+        return export
+
+    async def create_campaign_file_async(self, campaign: Campaign) -> ExcelExport:
+        """
+        Runs create_campaign_file in a worker thread, keeping the event loop responsive.
+        """
+        return await asyncio.to_thread(self.create_campaign_file, campaign)
+
 excel_service = ExcelService()
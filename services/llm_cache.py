@@ -0,0 +1,54 @@
+import hashlib
+import json
+import os
+from config import config
+from utils.disk_cache import DiskCache
+from utils.logger import get_logger
+
+logger = get_logger("llm_cache")
+
+class LLMCache:
+    """
+    Content-addressed cache of chat completions.
+    The key is a hash of the full request (model, messages and every parameter),
+    so any change to the prompt or settings is a different entry.
+    """
+
+    def __init__(self, path: str = None, max_entries: int = None, max_bytes: int = None):
+        self.store = DiskCache(
+            path or os.path.join(config.CACHE_DIR, "llm.sqlite"),
+            max_entries=max_entries or config.LLM_CACHE_MAX_ENTRIES,
+            max_bytes=max_bytes or config.LLM_CACHE_MAX_MB * 1024 * 1024
+        )
+
+    @staticmethod
+    def make_key(request: dict) -> str:
+        canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get(self, request: dict) -> str:
+        try:
+            return self.store.get(self.make_key(request))
+        except Exception as e:
+            logger.warning(f"LLM cache read failed: {e}")
+            return None
+
+    def put(self, request: dict, content: str, ttl: float):
+        # Never cache output the caller could not parse anyway
+        if not content:
+            return
+        if (request.get("response_format") or {}).get("type") == "json_object":
+            try:
+                json.loads(content)
+            except ValueError:
+                return
+        try:
+            self.store.set(self.make_key(request), content, ttl=ttl)
+        except Exception as e:
+            logger.warning(f"LLM cache write failed: {e}")
+
+    @property
+    def stats(self) -> dict:
+        return self.store.stats
+
+llm_cache = LLMCache()
@@ -0,0 +1,406 @@
+import asyncio
+import heapq
+import itertools
+import json
+import random
+import time
+from collections import deque
+from enum import IntEnum
+import openai
+from openai import AsyncOpenAI
+from config import config
+from services.llm_cache import llm_cache
+from utils.logger import get_logger
+from utils.rate_limit import TokenBucket
+from utils.tokens import estimate_messages_tokens
+
+logger = get_logger("llm_gateway")
+
+# Errors worth retrying: rate limits, timeouts, dropped connections and 5xx
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError
+)
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # The user is staring at a spinner (seed keywords)
+    NORMAL = 1       # Pipeline steps (LLM clustering)
+    BULK = 2         # Ad writing for whole campaigns
+
+class SiteStats:
+    """
+    Latency window and counters for one call site (e.g. "ads", "seeds").
+    """
+
+    def __init__(self, window: int = 200):
+        self.latencies = deque(maxlen=window)
+        self.first_delta = deque(maxlen=window)  # Streamed calls: time to the first fragment
+        self.calls = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def percentile(self, q: float, samples: deque = None) -> float:
+        samples = self.latencies if samples is None else samples
+        if len(samples) < config.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls, "timeouts": self.timeouts, "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins, "p95": self.percentile(0.95),
+            "p95_first_delta": self.percentile(0.95, self.first_delta)
+        }
+
+class LLMGateway:
+    """
+    Process-wide entry point for chat completions, shared by every call site and every user.
+
+    - Admission control: requests-per-minute and tokens-per-minute buckets, with the token
+      cost estimated from the prompt before the call and corrected from `usage` after it,
+      plus a cap on requests in flight.
+    - Priority: waiting requests are admitted strictly by Priority, then FIFO.
+    - Retries: rate-limit and transient errors are retried with jittered exponential
+      backoff (honouring Retry-After); other errors propagate to the caller.
+    - Deadlines: complete(deadline=...) bounds a call end to end, queueing and retries included.
+    - Hedging: a non-streamed call still running after its site's observed p95 latency gets
+      a duplicate; the first valid answer wins and the other is cancelled. A streamed call
+      gets one when it has sent nothing by the site's p95 time to first fragment; the stream
+      that speaks first wins. Hedges stay under LLM_HEDGE_MAX_RATIO of calls and are skipped
+      while requests are queueing.
+    - Caching: complete() serves and stores answers through llm_cache.
+    """
+
+    def __init__(self, client: AsyncOpenAI = None, rpm: int = None, tpm: int = None,
+                 max_concurrency: int = None, max_retries: int = None):
+        # The SDK's own retries would bypass the buckets
+        self.client = client or AsyncOpenAI(api_key=config.OPENAI_API_KEY, max_retries=0)
+        self.rpm = TokenBucket(rpm or config.LLM_RPM)
+        self.tpm = TokenBucket(tpm or config.LLM_TPM)
+        self.max_concurrency = max(1, max_concurrency or config.LLM_MAX_CONCURRENCY)
+        self.max_retries = config.LLM_MAX_RETRIES if max_retries is None else max_retries
+
+        self._cond = asyncio.Condition()
+        self._waiting: list[tuple[int, int]] = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._stats = {"requests": 0, "retries": 0, "rate_limited": 0, "failed": 0, "max_queue_depth": 0,
+                       "timeouts": 0, "hedges": 0, "hedge_wins": 0}
+        self._sites: dict[str, SiteStats] = {}
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiting)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def stats(self) -> dict:
+        return dict(self._stats, queue_depth=self.queue_depth, in_flight=self._in_flight,
+                    sites={name: site.as_dict() for name, site in self._sites.items()})
+
+    def summary(self) -> str:
+        s = self._stats
+        return (f"{s['requests']} requests, {s['retries']} retries, {s['rate_limited']} rate-limited, "
+                f"{s['timeouts']} timeouts, {s['hedges']} hedges ({s['hedge_wins']} won), queue {self.queue_depth}")
+
+    def _site(self, name: str) -> SiteStats:
+        if name not in self._sites:
+            self._sites[name] = SiteStats()
+        return self._sites[name]
+
+    def _estimate_tokens(self, request: dict) -> int:
+        completion = request.get("max_tokens") or config.LLM_COMPLETION_TOKENS
+        return estimate_messages_tokens(request.get("messages", [])) + completion
+
+    async def _admit(self, priority: int, tokens: int):
+        entry = (int(priority), next(self._seq))
+        async with self._cond:
+            heapq.heappush(self._waiting, entry)
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._waiting))
+            try:
+                while True:
+                    wait = None
+                    if self._waiting[0] == entry and self._in_flight < self.max_concurrency:
+                        wait = max(self.rpm.time_until(1), self.tpm.time_until(tokens))
+                        if wait <= 0:
+                            heapq.heappop(self._waiting)
+                            self.rpm.take(1)
+                            self.tpm.take(tokens)
+                            self._in_flight += 1
+                            # The next in line may be admissible too
+                            self._cond.notify_all()
+                            return
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                # Cancelled while queued: leave the line without blocking the others
+                if entry in self._waiting:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                raise
+
+    async def _release(self):
+        async with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = min(config.LLM_BACKOFF_MAX, config.LLM_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5)
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            delay = max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+        return delay
+
+    async def _run(self, priority: Priority, request: dict, attempt_fn):
+        """
+        Admission and retry loop around one call. attempt_fn(progress) performs the call and
+        returns (result, usage); it sets progress["delivered"] once output reached the caller,
+        after which a failure is no longer retried.
+        """
+        estimate = self._estimate_tokens(request)
+        for attempt in range(self.max_retries + 1):
+            await self._admit(priority, estimate)
+            progress = {"delivered": False}
+            try:
+                self._stats["requests"] += 1
+                result, usage = await attempt_fn(progress)
+            except RETRYABLE_ERRORS as e:
+                if isinstance(e, openai.RateLimitError):
+                    self._stats["rate_limited"] += 1
+                    self.rpm.drain()
+                if attempt == self.max_retries or progress["delivered"]:
+                    self._stats["failed"] += 1
+                    raise
+                delay = self._backoff(attempt, e)
+                self._stats["retries"] += 1
+                logger.warning(f"LLM call failed ({type(e).__name__}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            else:
+                if usage is not None and getattr(usage, "total_tokens", None):
+                    self.tpm.take(usage.total_tokens - estimate)
+                return result
+            finally:
+                await self._release()
+            await asyncio.sleep(delay)
+
+    async def _create_once(self, priority: Priority, request: dict, site: SiteStats = None):
+        async def attempt(progress: dict):
+            response = await self.client.chat.completions.create(**request)
+            return response, getattr(response, "usage", None)
+
+        started = time.monotonic()
+        response = await self._run(priority, request, attempt)
+        if site is not None:
+            site.latencies.append(time.monotonic() - started)
+        return response
+
+    @staticmethod
+    def _is_valid(response, request: dict) -> bool:
+        content = response.choices[0].message.content if response.choices else None
+        if not content:
+            return False
+        if (request.get("response_format") or {}).get("type") == "json_object":
+            try:
+                json.loads(content)
+            except ValueError:
+                return False
+        return True
+
+    def _hedge_allowed(self) -> bool:
+        # Extra tokens stay bounded, and a saturated gateway gains nothing from more requests
+        calls = sum(site.calls for site in self._sites.values())
+        return (self.queue_depth == 0
+                and self._stats["hedges"] < config.LLM_HEDGE_MAX_RATIO * max(calls, config.LLM_HEDGE_MIN_SAMPLES))
+
+    async def create(self, priority: Priority = Priority.NORMAL, site: str = None, **request):
+        """
+        chat.completions.create behind the buckets, priority queue and retries.
+        With a site name, latency is tracked per site and slow calls are hedged.
+        """
+        if site is None:
+            return await self._create_once(priority, request)
+
+        stats = self._site(site)
+        delay = stats.percentile(0.95) if config.LLM_HEDGE_ENABLED else None
+        primary = asyncio.create_task(self._create_once(priority, request, stats))
+        if delay is None:
+            return await primary
+
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self._hedge_allowed():
+                logger.debug(f"Hedging '{site}' call after {delay:.1f}s")
+                self._stats["hedges"] += 1
+                stats.hedges += 1
+                tasks.append(asyncio.create_task(self._create_once(priority, request, stats)))
+
+            pending = set(tasks)
+            fallback = None
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    response = task.result()
+                    if self._is_valid(response, request):
+                        if task is not primary:
+                            self._stats["hedge_wins"] += 1
+                            stats.hedge_wins += 1
+                        return response
+                    fallback = response
+            if fallback is not None:
+                return fallback
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # Mark as retrieved
+
+    async def _stream_once(self, on_delta, priority: Priority, request: dict) -> str:
+        async def attempt(progress: dict):
+            parts = []
+            usage = None
+            response = await self.client.chat.completions.create(
+                stream=True, stream_options={"include_usage": True}, **request
+            )
+            async for chunk in response:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    text = chunk.choices[0].delta.content
+                    parts.append(text)
+                    progress["delivered"] = True
+                    on_delta(text)
+            return "".join(parts), usage
+
+        return await self._run(priority, request, attempt)
+
+    async def stream(self, on_delta, priority: Priority = Priority.NORMAL, site: str = None, **request) -> str:
+        """
+        Streamed completion: on_delta(text) is called synchronously for every content fragment
+        as it arrives. Returns the full content. Keep on_delta cheap; it runs while the
+        request holds an in-flight slot.
+        With a site name, time to the first fragment is tracked per site, and a call that has
+        sent nothing by the site's p95 is hedged. Only the stream that delivers first ever
+        reaches on_delta; the other is cancelled.
+        """
+        stats = self._site(site) if site else None
+        owner = []  # Index of the stream whose fragments reach on_delta
+        first = asyncio.Event()
+
+        def relay(index: int):
+            started = time.monotonic()
+
+            def deliver(text: str):
+                if not owner:
+                    owner.append(index)
+                    first.set()
+                    if stats is not None:
+                        stats.first_delta.append(time.monotonic() - started)
+                if owner[0] == index:
+                    on_delta(text)
+            return deliver
+
+        delay = stats.percentile(0.95, stats.first_delta) if stats and config.LLM_HEDGE_ENABLED else None
+        primary = asyncio.create_task(self._stream_once(relay(0), priority, request))
+        if delay is None:
+            return await primary
+
+        tasks = [primary]
+        waiter = asyncio.create_task(first.wait())
+        try:
+            done, _ = await asyncio.wait([primary, waiter], timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+            if not done and self._hedge_allowed():
+                logger.debug(f"Hedging streamed '{site}' call after {delay:.1f}s without output")
+                self._stats["hedges"] += 1
+                stats.hedges += 1
+                tasks.append(asyncio.create_task(self._stream_once(relay(1), priority, request)))
+
+            while not owner:
+                live = [task for task in tasks if not task.done()]
+                if not live:
+                    # Nobody produced a fragment: any successful (empty) answer, else the error
+                    finished = [task for task in tasks if task.exception() is None]
+                    return (finished[0] if finished else primary).result()
+                await asyncio.wait(live + [waiter], return_when=asyncio.FIRST_COMPLETED)
+
+            winner = tasks[owner[0]]
+            for task in tasks:
+                if task is not winner:
+                    task.cancel()
+            if winner is not primary:
+                self._stats["hedge_wins"] += 1
+                stats.hedge_wins += 1
+            return await winner
+        finally:
+            waiter.cancel()
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # Mark as retrieved
+
+    async def complete(self, ttl: float, priority: Priority = Priority.NORMAL, use_cache: bool = True,
+                       on_delta=None, site: str = None, deadline: float = None, accept=None, **request) -> str:
+        """
+        Returns the message content for a chat completion, served from llm_cache when possible.
+        use_cache=False skips the lookup (e.g. deliberate creative regeneration) but still
+        stores the fresh answer. accept(content) -> bool lets the caller keep answers it
+        would reject out of the cache (they are still returned); a cached answer it rejects
+        counts as a miss.
+        With on_delta the completion is streamed (see stream); a cached answer is passed
+        to on_delta in one piece. Streamed calls are hedged on time to first fragment.
+        site names the call site for latency tracking, hedging and counters; deadline (seconds)
+        raises asyncio.TimeoutError when the call takes longer, whatever it was waiting on.
+        """
+        if use_cache:
+            cached = await asyncio.to_thread(llm_cache.get, request)
+            if cached is not None and (accept is None or accept(cached)):
+                logger.debug(f"LLM cache hit ({request.get('model')})")
+                if on_delta:
+                    on_delta(cached)
+                return cached
+
+        stats = self._site(site) if site else None
+        if stats:
+            stats.calls += 1
+
+        async def call() -> str:
+            if on_delta:
+                return await self.stream(on_delta, priority, site=site, **request)
+            response = await self.create(priority, site=site, **request)
+            return response.choices[0].message.content
+
+        try:
+            content = await asyncio.wait_for(call(), timeout=deadline)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            if stats:
+                stats.timeouts += 1
+            logger.warning(f"LLM call{f' ({site})' if site else ''} exceeded its deadline ({deadline}s)")
+            raise
+        if accept is None or accept(content):
+            await asyncio.to_thread(llm_cache.put, request, content, ttl)
+        return content
+
+    async def close(self):
+        await self.client.close()
+
+llm_gateway = LLMGateway()
@@ -1,25 +1,49 @@
+import asyncio
 import json
-from openai import AsyncOpenAI
 from config import config
+from services.llm_gateway import llm_gateway, Priority
+from services.ad_validator import legacy_ad_validator
 from utils.logger import get_logger
+from utils.tokens import chunk_by_tokens
 
 logger = get_logger("openai_service")
 
+FALLBACK_GROUP = "Общая группа"
+
 class OpenAIService:
     def __init__(self):
-        self.client = AsyncOpenAI(api_key=config.OPENAI_API_KEY)
+        self.gateway = llm_gateway
         self.model = "gpt-4-turbo-preview" # Using turbo-preview for JSON mode reliability
 
-    async def cluster_keywords(self, keywords: list[str]) -> dict[str, list[str]]:
+    async def cluster_keywords(self, keywords: list[str], use_cache: bool = True) -> dict[str, list[str]]:
         """
         Groups a list of keywords into semantic clusters.
+        A list that fits LLM_CLUSTER_CHUNK_TOKENS goes out in one request. Larger lists are
+        clustered map-reduce style: token-budgeted chunks in parallel, then a reduce pass
+        that merges equivalent group names across chunks. Latency follows the number of
+        parallel rounds, not the input size.
         Returns: { "Cluster Name": ["kw1", "kw2"] }
         """
         if not keywords:
             return {}
-            
-        logger.info(f"Clustering {len(keywords)} keywords...")
-        
+
+        keywords = list(dict.fromkeys(keywords))
+        chunks = chunk_by_tokens(keywords, config.LLM_CLUSTER_CHUNK_TOKENS)
+        if len(chunks) == 1:
+            logger.info(f"Clustering {len(keywords)} keywords...")
+            return await self._cluster_chunk(keywords, use_cache)
+
+        logger.info(f"Clustering {len(keywords)} keywords in {len(chunks)} chunks...")
+        semaphore = asyncio.Semaphore(max(1, config.LLM_CLUSTER_CONCURRENCY))
+
+        async def map_chunk(chunk: list[str]) -> dict[str, list[str]]:
+            async with semaphore:
+                return await self._cluster_chunk(chunk, use_cache)
+
+        partials = await asyncio.gather(*(map_chunk(chunk) for chunk in chunks))
+        return await self._merge_partials(partials, use_cache)
+
+    async def _cluster_chunk(self, keywords: list[str], use_cache: bool = True) -> dict[str, list[str]]:
         prompt = f"""
         You are a professional SEO specialist.
         Cluster the following list of Russian keywords into logical groups based on user intent and semantics.
@@ -33,7 +57,12 @@ class OpenAIService:
         """
 
         try:
-            response = await self.client.chat.completions.create(
+            content = await self.gateway.complete(
+                ttl=config.LLM_CACHE_TTL_CLUSTERS,
+                priority=Priority.NORMAL,
+                site="clusters",
+                deadline=config.LLM_DEADLINE_CLUSTERS,
+                use_cache=use_cache,
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "You are a helpful SEO assistant. Output valid JSON only."},
@@ -43,14 +72,112 @@ class OpenAIService:
                 temperature=0.3
             )
             
-            content = response.choices[0].message.content
-            return json.loads(content)
+            return self._sanitize_groups(json.loads(content), keywords)
         except Exception as e:
             logger.error(f"Clustering failed: {e}")
             # Fallback: everything in one group
-            return {"Общая группа": keywords}
+            return {FALLBACK_GROUP: keywords}
+
+    @staticmethod
+    def _sanitize_groups(groups: dict, keywords: list[str]) -> dict[str, list[str]]:
+        """
+        Keeps every input keyword exactly once: invented phrases are dropped,
+        phrases the model left out go to the fallback group.
+        """
+        originals = {kw.strip().lower(): kw for kw in keywords}
+        seen = set()
+        clean = {}
+        for name, members in (groups if isinstance(groups, dict) else {}).items():
+            if not isinstance(members, list):
+                continue
+            kept = []
+            for member in members:
+                key = member.strip().lower() if isinstance(member, str) else None
+                if key in originals and key not in seen:
+                    seen.add(key)
+                    kept.append(originals[key])
+            if kept:
+                clean.setdefault(str(name).strip() or FALLBACK_GROUP, []).extend(kept)
+
+        missing = [kw for key, kw in originals.items() if key not in seen]
+        if missing:
+            clean.setdefault(FALLBACK_GROUP, []).extend(missing)
+        return clean
+
+    async def _merge_partials(self, partials: list[dict[str, list[str]]], use_cache: bool = True) -> dict[str, list[str]]:
+        # Identical names (ignoring case) merge directly
+        merged = {}
+        display = {}
+        for partial in partials:
+            for name, members in partial.items():
+                key = name.strip().lower()
+                display.setdefault(key, name)
+                merged.setdefault(display[key], []).extend(members)
+
+        names = [name for name in merged if name != FALLBACK_GROUP]
+        mapping = await self._reduce_names(names, use_cache)
+
+        result = {}
+        for name, members in merged.items():
+            result.setdefault(mapping.get(name, name), []).extend(members)
+        logger.info(f"Merged {len(merged)} chunk groups into {len(result)}")
+        return result
+
+    async def _reduce_names(self, names: list[str], use_cache: bool = True) -> dict[str, str]:
+        """
+        Reduce pass: asks the model which group names from different chunks mean the same.
+        Only names travel, so the pass stays small whatever the keyword count.
+        Returns original name -> merged name; unmapped names stay as they are.
+        """
+        if len(names) < 2:
+            return {}
+
+        # Sorted, so names sharing a head word tend to land in the same reduce request
+        batches = chunk_by_tokens(sorted(names, key=str.lower), config.LLM_CLUSTER_CHUNK_TOKENS)
+        semaphore = asyncio.Semaphore(max(1, config.LLM_CLUSTER_CONCURRENCY))
+
+        async def reduce_batch(batch: list[str]) -> dict[str, str]:
+            prompt = f"""
+            These keyword group names were produced by clustering parts of one keyword list separately.
+            Merge names that describe the same user intent. Keep distinct intents separate.
+            Every original name must appear in exactly one merged group.
+            
+            Group names:
+            {json.dumps(batch, ensure_ascii=False)}
+            
+            Output format: JSON object where keys are merged group names (short, Russian) and values are lists of original names.
+            Example: {{ "Купить окна": ["Покупка окон", "Купить окно"], "Ремонт окон": ["Ремонт окон"] }}
+            """
+            async with semaphore:
+                try:
+                    content = await self.gateway.complete(
+                        ttl=config.LLM_CACHE_TTL_CLUSTERS,
+                        priority=Priority.NORMAL,
+                        site="cluster_merge",
+                        deadline=config.LLM_DEADLINE_CLUSTERS,
+                        use_cache=use_cache,
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": "You are a helpful SEO assistant. Output valid JSON only."},
+                            {"role": "user", "content": prompt}
+                        ],
+                        response_format={"type": "json_object"},
+                        temperature=0.3
+                    )
+                    groups = self._sanitize_groups(json.loads(content), batch)
+                except Exception as e:
+                    logger.error(f"Cluster name merge failed: {e}")
+                    return {}
+            # Names the model left out keep their own group
+            groups.pop(FALLBACK_GROUP, None)
+            return {original: merged for merged, originals in groups.items() for original in originals}
+
+        mapping = {}
+        for part in await asyncio.gather(*(reduce_batch(batch) for batch in batches)):
+            mapping.update(part)
+        return mapping
 
-    async def generate_seed_keywords(self, site_text: str) -> list[str]:
+    async def generate_seed_keywords(self, site_text: str, use_cache: bool = True) -> list[str]:
         """
         Analyzes site text and returns 3-5 seed keywords for Wordstat.
         """
@@ -68,7 +195,12 @@ class OpenAIService:
         """
 
         try:
-            response = await self.client.chat.completions.create(
+            content = await self.gateway.complete(
+                ttl=config.LLM_CACHE_TTL_SEEDS,
+                priority=Priority.INTERACTIVE,
+                site="seeds",
+                deadline=config.LLM_DEADLINE_SEEDS,
+                use_cache=use_cache,
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "You are a PPC specialist."},
@@ -77,14 +209,14 @@ class OpenAIService:
                 response_format={"type": "json_object"},
                 temperature=0.7
             )
-            content = response.choices[0].message.content
             data = json.loads(content)
             return data.get("phrases", [])
         except Exception as e:
             logger.error(f"Seed generation failed: {e}")
             return []
 
-    async def generate_ads(self, cluster_name: str, keywords: list[str], context: str = None) -> list[dict]:
+    async def generate_ads(self, cluster_name: str, keywords: list[str], context: str = None,
+                           use_cache: bool = True) -> list[dict]:
         """
         Generates 2 text ads for a given cluster.
         Returns data for columns: Title1, Title2, Text.
@@ -116,7 +248,12 @@ class OpenAIService:
         """
 
         try:
-            response = await self.client.chat.completions.create(
+            content = await self.gateway.complete(
+                ttl=config.LLM_CACHE_TTL_ADS,
+                priority=Priority.BULK,
+                site="legacy_ads",
+                deadline=config.LLM_DEADLINE_ADS,
+                use_cache=use_cache,
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "You are a professional copywriter for PPC ads. Strict length constraints."},
@@ -126,9 +263,8 @@ class OpenAIService:
                 temperature=0.7
             )
             
-            content = response.choices[0].message.content
             data = json.loads(content)
-            return data.get("ads", [])
+            return await legacy_ad_validator.fix_ads(data.get("ads", []), cluster_name)
         except Exception as e:
             logger.error(f"Ad generation failed for {cluster_name}: {e}")
             return []
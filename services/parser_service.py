@@ -1,14 +1,64 @@
-from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from bs4 import BeautifulSoup
-import time
+from collections import deque
+from dataclasses import dataclass
+import aiohttp
 import asyncio
+import codecs
+import html as html_lib
+import re
+import time
+from config import config
+from services.browser_pool import BrowserPool, PoolBusyError, wait_until_settled
+from services.text_extractor import extract_text
+from services.url_cache import url_cache
 from utils.logger import get_logger
 
 logger = get_logger("parser_service")
 
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
+
+BLOCK_MARKERS = ["captcha", "access denied", "robot", "security"]
+# Markup of client-side rendered apps whose server HTML carries no real content
+JS_ONLY_MARKERS = [
+    "enable javascript", "включите javascript", "javascript is required",
+    'id="root"></div>', 'id="app"></div>', 'id="__next"></div>', 'id="__nuxt"></div>'
+]
+
+# <meta charset="..."> or <meta http-equiv="Content-Type" content="text/html; charset=...">
+META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([A-Za-z0-9_.:-]+)""", re.IGNORECASE)
+META_SNIFF_BYTES = 2048
+
+def sniff_charset(head: bytes) -> str:
+    """
+    Encoding declared in the page itself (BOM or meta tag), or None.
+    Many Russian sites declare windows-1251 only there, not in Content-Type.
+    """
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8"
+    match = META_CHARSET_RE.search(head[:META_SNIFF_BYTES])
+    if not match:
+        return None
+    try:
+        return codecs.lookup(match.group(1).decode("ascii")).name
+    except (LookupError, UnicodeDecodeError):
+        return None
+
+@dataclass
+class FetchRecord:
+    url: str
+    tier: str  # "cache", "revalidated", "http", "browser" or "failed"
+    elapsed: float
+    chars: int
+    reason: str = ""  # Why the HTTP tier escalated, if it did
+
+@dataclass
+class HttpPage:
+    status: int
+    title: str = ""
+    html: str = ""
+    etag: str = None
+    last_modified: str = None
+
 class ParserService:
     def __init__(self):
         self.options = Options()
@@ -18,74 +68,205 @@ class ParserService:
         self.options.add_argument("--disable-blink-features=AutomationControlled")
         self.options.add_experimental_option("excludeSwitches", ["enable-automation"])
         self.options.add_experimental_option('useAutomationExtension', False)
-        self.options.add_argument("user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36")
+        self.options.add_argument(f"user-agent={USER_AGENT}")
+        self.browser_pool = BrowserPool(self.options)
+        self._session: aiohttp.ClientSession = None
+
+        # Recent fetches and per-tier counters, for tuning the escalation thresholds
+        self.fetch_log: deque[FetchRecord] = deque(maxlen=500)
+        self.tier_stats = {"cache": 0, "revalidated": 0, "http": 0, "browser": 0, "failed": 0}
+
+    async def start(self):
+        """
+        Warms up the browser pool. Called on dispatcher startup.
+        """
+        try:
+            await self.browser_pool.start()
+        except Exception as e:
+            # The bot still works without a browser: users can paste site text manually
+            logger.error(f"Browser pool startup failed: {e}")
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        await self.browser_pool.close()
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if not self._session or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=config.HTTP_FETCH_TIMEOUT),
+                headers={
+                    "User-Agent": USER_AGENT,
+                    "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8",
+                    "Accept-Language": "ru-RU,ru;q=0.9,en;q=0.8"
+                }
+            )
+        return self._session
+
+    @staticmethod
+    def _load_page(driver, url: str) -> tuple[str, str]:
+        """
+        Runs in a browser pool thread. Returns (title, html).
+        """
+        driver.get(url)
+
+        # Allow JS/redirects to finish, but no longer than needed
+        wait_until_settled(driver)
+        return driver.title, driver.page_source
 
-    async def fetch_text(self, url: str, max_chars: int = 4000) -> str:
+    async def _fetch_http(self, url: str, cached: dict = None) -> HttpPage:
         """
-        Fetches the URL using Selenium (headless) and extracts visible text.
+        Plain GET with a tight timeout. The body is cut at HTTP_FETCH_MAX_BYTES and
+        decoded with the Content-Type charset, else the one declared in the page's
+        BOM / meta tag, else UTF-8. With a cached entry the request is
+        conditional and may come back as 304 without a body. Returns None on failure.
+        """
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        session = await self._get_session()
+        async with session.get(url, allow_redirects=True, headers=headers) as resp:
+            if resp.status == 304:
+                return HttpPage(status=304)
+            if resp.status != 200:
+                logger.info(f"HTTP tier got status {resp.status} for {url}")
+                return None
+            if "html" not in resp.headers.get("Content-Type", "text/html"):
+                return None
+
+            decoder = None
+            parts = []
+            received = 0
+            async for chunk in resp.content.iter_chunked(64 * 1024):
+                if decoder is None:
+                    decoder = codecs.getincrementaldecoder(resp.charset or sniff_charset(chunk) or "utf-8")(errors="replace")
+                received += len(chunk)
+                parts.append(decoder.decode(chunk))
+                if received >= config.HTTP_FETCH_MAX_BYTES:
+                    logger.debug(f"HTTP tier hit size cap for {url}")
+                    break
+            if decoder is not None:
+                parts.append(decoder.decode(b"", final=True))
+            etag = resp.headers.get("ETag")
+            last_modified = resp.headers.get("Last-Modified")
+
+        html = "".join(parts)
+        match = re.search(r"<title[^>]*>(.*?)</title>", html, re.IGNORECASE | re.DOTALL)
+        title = html_lib.unescape(match.group(1)).strip() if match else ""
+        return HttpPage(status=200, title=title, html=html, etag=etag, last_modified=last_modified)
+
+    @staticmethod
+    async def _extract_text(html: str, max_chars: int) -> str:
+        # Parsing heavy pages is CPU work: keep it off the event loop
+        return await asyncio.to_thread(extract_text, html, max_chars)
+
+    @staticmethod
+    def _rejection_reason(title: str, text: str, html: str = None) -> str:
+        """
+        Returns why the extracted text is unusable, or "" if it is fine.
+        html is only passed for the HTTP tier, where JS-only pages must escalate.
+        """
+        title = title.lower()
+        if any(marker in title for marker in BLOCK_MARKERS):
+            return f"blocked title: {title}"
+        if "captcha" in text.lower():
+            return "captcha in text"
+        replaced = text.count("\ufffd")
+        if replaced > max(10, len(text) // 100):
+            # Wrong or missing charset: mojibake must not reach the cache or the LLM
+            return f"undecodable text ({replaced} replacement chars)"
+        if len(text) < config.PARSER_MIN_TEXT_CHARS:
+            if html is not None and any(marker in html.lower() for marker in JS_ONLY_MARKERS):
+                return f"js-only page ({len(text)} chars)"
+            return f"too short ({len(text)} chars)"
+        return ""
+
+    def _record(self, url: str, tier: str, started: float, chars: int, reason: str = ""):
+        record = FetchRecord(url=url, tier=tier, elapsed=time.perf_counter() - started, chars=chars, reason=reason)
+        self.fetch_log.append(record)
+        self.tier_stats[tier] += 1
+        logger.info(f"Fetched {url} via {tier} in {record.elapsed:.2f}s ({chars} chars)"
+                    + (f", escalated: {reason}" if reason else ""))
+
+    async def fetch_text(self, url: str, max_chars: int = 4000, refresh: bool = False) -> str:
+        """
+        Fetches the URL and extracts visible text.
+        Serves fresh cached text first, then tries a (conditional) plain HTTP GET and
+        only falls back to headless Selenium when the result is too short, blocked
+        or rendered client-side. refresh=True ignores the cache.
         """
         if not url.startswith("http"):
             url = "https://" + url
-            
-        logger.info(f"Fetching URL with Selenium: {url}")
-        
-        driver = None
+
+        started = time.perf_counter()
+        escalation = ""
+
+        cached = None if refresh else await asyncio.to_thread(url_cache.get_page, url, max_chars)
+        if cached and url_cache.is_fresh(cached):
+            self._record(url, "cache", started, len(cached["text"]))
+            return cached["text"]
+
+        # Tier 1: fast HTTP (conditional if the page was served by this tier before)
         try:
-            service = Service(ChromeDriverManager().install())
-            driver = webdriver.Chrome(service=service, options=self.options)
-            
-            # Stealth maneuvering
-            driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-            
-            driver.set_page_load_timeout(30)
-            driver.get(url)
-            
-            # Allow some time for JS/redirects
-            time.sleep(5)
-            
-            # Save screenshot for debugging
-            driver.save_screenshot("debug_last_page.png")
-            
-            # Check title for common blockers
-            title = driver.title.lower()
-            logger.info(f"Page Title: {driver.title}")
-            
-            if "captcha" in title or "access denied" in title or "robot" in title or "security" in title:
-                logger.warning(f"Blocking detected in title: {title}")
-                return None
-            
-            html = driver.page_source
-            soup = BeautifulSoup(html, 'html.parser')
-            
-            # Remove scripts, styles, etc.
-            for element in soup(['script', 'style', 'header', 'footer', 'nav', 'noscript', 'iframe', 'svg']):
-                element.decompose()
-                
-            text = soup.get_text(separator=' ', strip=True)
-            
-            # Simple cleaning
-            lines = [line.strip() for line in text.splitlines() if line.strip()]
-            cleaned_text = ' '.join(lines)
-            
-            # Limit length
-            if len(cleaned_text) > max_chars:
-                cleaned_text = cleaned_text[:max_chars] + "..."
-                
+            page = await self._fetch_http(url, cached if cached and cached.get("tier") == "http" else None)
+            if page and page.status == 304:
+                await asyncio.to_thread(url_cache.put_page, url, max_chars, cached["text"], "http",
+                                        etag=cached.get("etag"), last_modified=cached.get("last_modified"))
+                self._record(url, "revalidated", started, len(cached["text"]))
+                return cached["text"]
+
+            if page:
+                cleaned_text = await self._extract_text(page.html, max_chars)
+                escalation = self._rejection_reason(page.title, cleaned_text, page.html)
+                if not escalation:
+                    await asyncio.to_thread(url_cache.put_page, url, max_chars, cleaned_text, "http",
+                                            etag=page.etag, last_modified=page.last_modified)
+                    self._record(url, "http", started, len(cleaned_text))
+                    return cleaned_text
+            else:
+                escalation = "http fetch failed"
+        except Exception as e:
+            escalation = f"http error: {e}"
+
+        # Tier 2: headless browser
+        logger.info(f"Fetching URL with Selenium: {url} ({escalation})")
+
+        try:
+            page_title, html = await self.browser_pool.run(lambda driver: self._load_page(driver, url))
+        except PoolBusyError as e:
+            logger.warning(f"Browser pool busy, skipping {url}: {e}")
+            self._record(url, "failed", started, 0, escalation)
+            return None
+        except Exception as e:
+            logger.error(f"Selenium Parsing error: {e}")
+            self._record(url, "failed", started, 0, escalation)
+            return None
+
+        try:
+            logger.info(f"Page Title: {page_title}")
+            cleaned_text = await self._extract_text(html, max_chars)
             logger.info(f"Extracted {len(cleaned_text)} chars")
-            
+
             # Detection checks
-            if len(cleaned_text) < 200 or "captcha" in cleaned_text.lower():
-                logger.warning("Extracted text seems to be a CAPTCHA or empty.")
+            reason = self._rejection_reason(page_title, cleaned_text)
+            if reason:
+                logger.warning(f"Extracted text seems to be a CAPTCHA or empty: {reason}")
+                self._record(url, "failed", started, len(cleaned_text), escalation)
                 # We return None to trigger the manual fallback in logic
                 return None
-            
+
+            await asyncio.to_thread(url_cache.put_page, url, max_chars, cleaned_text, "browser")
+            self._record(url, "browser", started, len(cleaned_text), escalation)
             return cleaned_text
-            
+
         except Exception as e:
             logger.error(f"Selenium Parsing error: {e}")
+            self._record(url, "failed", started, 0, escalation)
             return None
-        finally:
-            if driver:
-                driver.quit()
 
 parser_service = ParserService()
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import pickle
+import time
+from config import config
+from utils.logger import get_logger
+
+logger = get_logger("project_store")
+
+class ProjectStore:
+    """
+    Persisted clustering state per project, so a campaign can be extended without a rebuild.
+
+    Each project directory holds:
+      - model.pkl:  the fitted clustering model (vectorizer / SVD / centroids), used to assign new keywords
+      - state.json: cluster membership, canonical -> original phrases, Shows per phrase,
+                    generated ads and the cluster size each ad set was written for
+    """
+
+    def __init__(self, root: str = None):
+        self.root = root or os.path.join(config.CACHE_DIR, "projects")
+
+    def _dir(self, project_id: str) -> str:
+        # Project ids contain user input; hash them into a safe directory name
+        digest = hashlib.sha1(project_id.encode('utf-8')).hexdigest()[:20]
+        return os.path.join(self.root, digest)
+
+    def load_state(self, project_id: str) -> dict:
+        path = os.path.join(self._dir(project_id), "state.json")
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+        except Exception as e:
+            logger.error(f"Failed to read project {project_id}: {e}")
+            return None
+
+        # JSON object keys are strings; cluster ids are ints everywhere else
+        for field in ("clusters", "ads", "ads_size"):
+            state[field] = {int(k): v for k, v in state.get(field, {}).items()}
+        state.setdefault("members", {})
+        state.setdefault("shows", {})
+        return state
+
+    def save_state(self, project_id: str, state: dict):
+        directory = self._dir(project_id)
+        os.makedirs(directory, exist_ok=True)
+        state = dict(state, project_id=project_id, updated_at=time.time())
+
+        # Write-then-rename so a crash never leaves a half-written file
+        tmp_path = os.path.join(directory, "state.json.tmp")
+        with open(tmp_path, "w", encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(directory, "state.json"))
+
+    def load_model(self, project_id: str):
+        path = os.path.join(self._dir(project_id), "model.pkl")
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            logger.error(f"Failed to load model for project {project_id}: {e}")
+            return None
+
+    def save_model(self, project_id: str, model):
+        directory = self._dir(project_id)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, "model.pkl.tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, os.path.join(directory, "model.pkl"))
+
+    @staticmethod
+    def stale_clusters(state: dict, change_ratio: float = None) -> list[int]:
+        """
+        Clusters whose ads must be (re)generated: never written, or grown by at least
+        change_ratio (CLUSTER_CHANGE_RATIO) since the ads were written.
+        """
+        ratio = config.CLUSTER_CHANGE_RATIO if change_ratio is None else change_ratio
+        stale = []
+        for cluster_id, keywords in state["clusters"].items():
+            written_for = state["ads_size"].get(cluster_id)
+            if not state["ads"].get(cluster_id) or not written_for or len(keywords) - written_for >= ratio * written_for:
+                stale.append(cluster_id)
+        return stale
+
+project_store = ProjectStore()
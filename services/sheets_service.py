@@ -1,9 +1,22 @@
+import asyncio
+import random
+import threading
+import time
+from itertools import islice
 import gspread
 from config import config
+from services.campaign_model import Campaign
 from utils.logger import get_logger
 
 logger = get_logger("sheets_service")
 
+# Headers: Group, Keyword, Headline 1, Headline 2, Text, Path
+HEADER = ["Группа", "Ключевая фраза", "Заголовок 1", "Заголовок 2", "Текст", "Ссылка"]
+
+def a1_range(title: str, start_row: int) -> str:
+    # Tab titles are user input: quote them and double any single quotes
+    return "'{}'!A{}".format(title.replace("'", "''"), start_row)
+
 class SheetsService:
     def __init__(self):
         try:
@@ -12,78 +25,137 @@ class SheetsService:
         except Exception as e:
             logger.error(f"Failed to connect to Google Sheets: {e}")
             self.gc = None
+        self.chunk_rows = config.SHEETS_CHUNK_ROWS
+        self._master = None
+        self._master_lock = threading.Lock()
+
+    def master_sheet(self, master_id: str):
+        """
+        Opens the master spreadsheet once and reuses the handle for every report.
+        """
+        with self._master_lock:
+            if self._master is None:
+                self._master = self.gc.open_by_key(master_id)
+            return self._master
+
+    def reset_master(self):
+        # The cached handle may be stale (sheet deleted, access revoked)
+        with self._master_lock:
+            self._master = None
 
-    async def create_report_sheet(self, user_id: int, project_name: str, campaign_data: list):
+    @staticmethod
+    def iter_rows(campaign: Campaign):
+        # Groups without ads still list their keywords
+        yield HEADER
+        for group_name, phrase, _, ad in campaign.iter_rows(require_ad=False):
+            yield [group_name, phrase, ad.get('headline_1', ''), ad.get('headline_2', ''),
+                   ad.get('text', ''), ad.get('path', '')]
+
+    @staticmethod
+    def layout_requests(sheet_id: int, rows: int) -> list[dict]:
+        """
+        Grid size from the data (header frozen) plus bold header, for one batch_update.
+        The grid keeps at least one row below the header: the API refuses to freeze every row.
+        """
+        rows = max(rows, 2)
+        return [
+            {"updateSheetProperties": {
+                "properties": {"sheetId": sheet_id, "gridProperties": {
+                    "rowCount": rows, "columnCount": len(HEADER), "frozenRowCount": 1}},
+                "fields": "gridProperties(rowCount,columnCount,frozenRowCount)"
+            }},
+            {"repeatCell": {
+                "range": {"sheetId": sheet_id, "startRowIndex": 0, "endRowIndex": 1},
+                "cell": {"userEnteredFormat": {"textFormat": {"bold": True}}},
+                "fields": "userEnteredFormat.textFormat.bold"
+            }}
+        ]
+
+    def _add_tab(self, sh, title: str, rows: int) -> tuple[int, str]:
+        """
+        Creates the tab already sized and formatted: addSheet with a preassigned sheetId
+        lets the header formatting go in the same batch_update. Returns (sheet id, title).
         """
-        Creates a new sheet and populates it with campaign data.
-        campaign_data: List of dicts [{"group_name": str, "keywords": [], "ads": []}]
+        for attempt in range(2):
+            sheet_id = random.randint(1, 2**31 - 1)
+            add = {"addSheet": {"properties": {"sheetId": sheet_id, "title": title}}}
+            try:
+                sh.batch_update({"requests": [add] + self.layout_requests(sheet_id, rows)})
+                return sheet_id, title
+            except gspread.exceptions.APIError:
+                if attempt:
+                    raise
+                # Title (or, rarely, id) already taken
+                title = f"{title}_{int(time.time())}"
+
+    def _write_values(self, sh, title: str, rows) -> int:
+        """
+        Writes rows in chunks of SHEETS_CHUNK_ROWS, one values_batch_update per chunk,
+        so large tables never build one huge request. Returns the number of rows written.
+        """
+        written = 0
+        while True:
+            chunk = list(islice(rows, self.chunk_rows))
+            if not chunk:
+                return written
+            sh.values_batch_update({
+                "valueInputOption": "RAW",
+                "data": [{"range": a1_range(title, written + 1), "values": chunk}]
+            })
+            written += len(chunk)
+
+    def create_report_sheet_sync(self, user_id: int, project_name: str, campaign: Campaign):
+        """
+        Creates a new sheet and populates it with campaign data. Blocking: handlers
+        call create_report_sheet, which runs this in a worker thread.
+
+        API calls: one batch_update that creates, sizes and formats the tab, then one
+        values_batch_update per SHEETS_CHUNK_ROWS rows.
         """
         if not self.gc:
             logger.error("Google Client not initialized")
             return None
 
-        sheet_title = f"Report_{project_name}_{user_id}"
-        
+        start = time.perf_counter()
+        total_rows = len(campaign) + 1
         try:
             # Plan C: Use Master Sheet
             master_id = getattr(config, 'GOOGLE_MASTER_SHEET_ID', None)
-            
+
             if master_id:
                 try:
-                    sh = self.gc.open_by_key(master_id)
+                    sh = self.master_sheet(master_id)
                 except Exception as e:
                     logger.error(f"Failed to open master sheet: {e}")
                     return None
 
                 # Create new tab
-                tab_title = f"{project_name[:30]}_{user_id}"
                 try:
-                    ws = sh.add_worksheet(title=tab_title, rows=1000, cols=10)
+                    sheet_id, title = self._add_tab(sh, f"{project_name[:30]}_{user_id}", total_rows)
                 except gspread.exceptions.APIError:
-                    import time
-                    ws = sh.add_worksheet(title=f"{tab_title}_{int(time.time())}", rows=1000, cols=10)
+                    self.reset_master()
+                    raise
             else:
                 # Fallback to creation
-                sh = self.gc.create(sheet_title)
+                sh = self.gc.create(f"Report_{project_name}_{user_id}")
                 sh.share(None, perm_type='anyone', role='reader')
-                ws = sh.sheet1
-                
-            if not master_id:
-                ws.update_title("Семантика")
-            
-            # Prepare rows
-            # Headers: Group, Keyword, Headline 1, Headline 2, Text, Path
-            rows = [["Группа", "Ключевая фраза", "Заголовок 1", "Заголовок 2", "Текст", "Ссылка"]]
-            
-            for group in campaign_data:
-                group_name = group.get("group_name", "")
-                keywords = group.get("keywords", [])
-                ads = group.get("ads", [])
-                
-                # Use first ad variant
-                ad = ads[0] if ads else {}
-                
-                for kw in keywords:
-                    # If kw is tuple (kw, shows), extract kw
-                    phrase = kw[0] if isinstance(kw, (list, tuple)) else kw
-                    
-                    rows.append([
-                        group_name,
-                        phrase,
-                        ad.get('headline_1', ''),
-                        ad.get('headline_2', ''),
-                        ad.get('text', ''),
-                        ad.get('path', '')
-                    ])
-                    
-            ws.update(rows)
-            # Format header
-            ws.format('A1:F1', {'textFormat': {'bold': True}})
-            
-            return sh.url
-            
+                sheet_id, title = sh.sheet1.id, "Семантика"
+                rename = {"updateSheetProperties": {"properties": {"sheetId": sheet_id, "title": title},
+                                                    "fields": "title"}}
+                sh.batch_update({"requests": [rename] + self.layout_requests(sheet_id, total_rows)})
+
+            written = self._write_values(sh, title, self.iter_rows(campaign))
+            logger.info(f"Sheet '{title}' written: {written} rows in {time.perf_counter() - start:.2f}s")
+            return f"{sh.url}#gid={sheet_id}"
+
         except Exception as e:
             logger.error(f"Failed to create sheet: {e}")
             return None
 
+    async def create_report_sheet(self, user_id: int, project_name: str, campaign: Campaign):
+        """
+        Runs create_report_sheet_sync in a worker thread, keeping the event loop responsive.
+        """
+        return await asyncio.to_thread(self.create_report_sheet_sync, user_id, project_name, campaign)
+
 sheets_service = SheetsService()
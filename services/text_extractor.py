@@ -0,0 +1,121 @@
+from html.parser import HTMLParser
+from utils.logger import get_logger
+
+try:
+    from lxml import etree
+except ImportError:  # Optional: the stdlib parser is slower but has the same output
+    etree = None
+
+logger = get_logger("text_extractor")
+
+# Subtrees whose text never reaches the output
+SKIP_TAGS = frozenset(['script', 'style', 'header', 'footer', 'nav', 'noscript', 'iframe', 'svg'])
+FEED_CHUNK = 32 * 1024
+
+class _TextCollector:
+    """
+    Receives parser events, drops text inside SKIP_TAGS and stops collecting
+    once the character budget is exceeded.
+    Output matches BeautifulSoup's get_text(separator=' ', strip=True) followed
+    by joining the stripped lines with spaces.
+    """
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.parts: list[str] = []
+        self.length = 0
+        self.skip_depth = 0
+        self.done = False
+        self._buffer: list[str] = []
+
+    def start(self, tag, attrib=None):
+        self._flush()
+        if tag.lower() in SKIP_TAGS:
+            self.skip_depth += 1
+
+    def end(self, tag):
+        self._flush()
+        if tag.lower() in SKIP_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+
+    def data(self, text):
+        if not self.skip_depth and not self.done:
+            self._buffer.append(text)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        self._flush()
+        return self.text()
+
+    def _flush(self):
+        # A text node may arrive in several data() calls; strip it as a whole
+        if not self._buffer:
+            return
+        node = "".join(self._buffer)
+        self._buffer = []
+        if self.done:
+            return
+
+        for line in node.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            self.parts.append(line)
+            self.length += len(line) + (1 if len(self.parts) > 1 else 0)
+            if self.length > self.max_chars:
+                self.done = True
+                return
+
+    def text(self) -> str:
+        cleaned_text = ' '.join(self.parts)
+        if len(cleaned_text) > self.max_chars:
+            cleaned_text = cleaned_text[:self.max_chars] + "..."
+        return cleaned_text
+
+class _StdlibParser(HTMLParser):
+    def __init__(self, collector: _TextCollector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag)
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        # Self-closing element: opens no subtree
+        self.collector._flush()
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+def extract_text(html: str, max_chars: int = 4000) -> str:
+    """
+    Extracts visible text from an HTML page in a single streaming pass.
+    Unwanted elements are skipped while parsing and the parse stops as soon
+    as max_chars is exceeded.
+    """
+    if not html:
+        return ""
+
+    collector = _TextCollector(max_chars)
+
+    if etree is not None:
+        parser = etree.HTMLParser(target=collector, remove_comments=True, no_network=True, recover=True)
+    else:
+        parser = _StdlibParser(collector)
+
+    try:
+        for offset in range(0, len(html), FEED_CHUNK):
+            parser.feed(html[offset:offset + FEED_CHUNK])
+            if collector.done:
+                break
+        parser.close()
+    except Exception as e:
+        # Broken markup: keep whatever text was collected so far
+        logger.debug(f"HTML parse stopped early: {e}")
+
+    return collector.close()
@@ -0,0 +1,78 @@
+import hashlib
+import os
+import time
+from config import config
+from utils.disk_cache import DiskCache
+from utils.logger import get_logger
+
+logger = get_logger("url_cache")
+
+class UrlCache:
+    """
+    Per-URL cache for site analysis: the extracted page text with its HTTP validators,
+    and the seed keywords generated from that text.
+
+    Pages served by the HTTP tier are revalidated with ETag / Last-Modified;
+    browser-rendered pages (or pages without validators) are trusted for a fixed TTL.
+    Seeds are keyed by a hash of the text, so they are reused only while the page is unchanged.
+    """
+
+    def __init__(self, path: str = None, max_entries: int = None):
+        self.store = DiskCache(
+            path or os.path.join(config.CACHE_DIR, "urls.sqlite"),
+            max_entries=max_entries or config.URL_CACHE_MAX_ENTRIES,
+            default_ttl=config.URL_CACHE_RETENTION
+        )
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_page(self, url: str, max_chars: int) -> dict:
+        """
+        Returns the cached entry: {text, tier, etag, last_modified, fetched_at}, or None.
+        """
+        return self.store.get(f"page|{max_chars}|{url}")
+
+    def put_page(self, url: str, max_chars: int, text: str, tier: str,
+                 etag: str = None, last_modified: str = None):
+        try:
+            self.store.set(f"page|{max_chars}|{url}", {
+                "text": text,
+                "tier": tier,
+                "etag": etag,
+                "last_modified": last_modified,
+                "fetched_at": time.time()
+            })
+        except Exception as e:
+            logger.warning(f"Failed to cache page {url}: {e}")
+
+    @staticmethod
+    def is_fresh(entry: dict) -> bool:
+        """
+        True if the entry can be served without touching the site.
+        """
+        if entry.get("tier") == "http" and (entry.get("etag") or entry.get("last_modified")):
+            return False # Cheap to revalidate, so always ask the server
+        ttl = config.URL_CACHE_HTTP_TTL if entry.get("tier") == "http" else config.URL_CACHE_BROWSER_TTL
+        return time.time() - entry.get("fetched_at", 0) < ttl
+
+    def get_seeds(self, url: str, text: str) -> list[str]:
+        entry = self.store.get(f"seeds|{url}")
+        if entry and entry.get("content_hash") == self.content_hash(text):
+            return entry.get("seeds")
+        return None
+
+    def put_seeds(self, url: str, text: str, seeds: list[str]):
+        if not seeds:
+            return
+        try:
+            self.store.set(f"seeds|{url}", {"content_hash": self.content_hash(text), "seeds": seeds})
+        except Exception as e:
+            logger.warning(f"Failed to cache seeds for {url}: {e}")
+
+    @property
+    def stats(self) -> dict:
+        return self.store.stats
+
+url_cache = UrlCache()
@@ -0,0 +1,48 @@
+import os
+import re
+from config import config
+from utils.disk_cache import DiskCache
+from utils.logger import get_logger
+
+logger = get_logger("wordstat_cache")
+
+class WordstatCache:
+    """
+    On-disk cache of Wordstat 'SearchedWith' results, keyed by normalized phrase and GeoID.
+    """
+
+    def __init__(self, path: str = None, ttl: float = None, max_entries: int = None, max_bytes: int = None):
+        self.store = DiskCache(
+            path or os.path.join(config.CACHE_DIR, "wordstat.sqlite"),
+            max_entries=max_entries or config.WORDSTAT_CACHE_MAX_ENTRIES,
+            max_bytes=max_bytes or config.WORDSTAT_CACHE_MAX_MB * 1024 * 1024,
+            default_ttl=ttl or config.WORDSTAT_CACHE_TTL
+        )
+
+    @staticmethod
+    def normalize(phrase: str) -> str:
+        phrase = phrase.lower().replace('ё', 'е')
+        return re.sub(r"\s+", " ", phrase).strip()
+
+    def _key(self, phrase: str, geo_id: list[int] = None) -> str:
+        geo = ",".join(str(g) for g in sorted(geo_id)) if geo_id else "0"
+        return f"{self.normalize(phrase)}|{geo}"
+
+    def get(self, phrase: str, geo_id: list[int] = None) -> list[tuple[str, int]]:
+        """
+        Returns cached (keyword, shows) pairs, or None on a miss.
+        """
+        cached = self.store.get(self._key(phrase, geo_id))
+        if cached is None:
+            return None
+        return [(kw, shows) for kw, shows in cached]
+
+    def put(self, phrase: str, geo_id: list[int], results: list[tuple[str, int]]):
+        try:
+            self.store.set(self._key(phrase, geo_id), [list(item) for item in results])
+        except Exception as e:
+            logger.warning(f"Failed to cache Wordstat results for '{phrase}': {e}")
+
+    @property
+    def stats(self) -> dict:
+        return self.store.stats
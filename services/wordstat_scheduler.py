@@ -0,0 +1,330 @@
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from config import config
+from utils.logger import get_logger
+
+logger = get_logger("wordstat_scheduler")
+
+# error_code of CreateNewWordstatReport when the account has no free report slot
+REPORT_LIMIT_ERROR = 31
+
+@dataclass
+class _Report:
+    report_id: int
+    geo: tuple[int, ...]
+    phrases: list[str]
+    # phrase -> futures of every caller waiting for it
+    waiters: dict[str, list[asyncio.Future]]
+    deadline: float
+
+class WordstatScheduler:
+    """
+    Process-wide multiplexer for Wordstat reports.
+
+    Seed phrases from all callers are queued per GeoID and packed into as few reports
+    as the account limits allow. A single GetWordstatReportList poll serves every
+    in-flight report, backing off while nothing changes, and each finished report
+    is fanned back out to the callers waiting on its phrases.
+    """
+
+    def __init__(self, client, max_reports: int = None, max_phrases: int = None):
+        # client: object with create_report / get_report_list / get_report / delete_report
+        self.client = client
+        self.max_reports = max_reports or config.WORDSTAT_MAX_REPORTS
+        self.max_phrases = max_phrases or config.WORDSTAT_MAX_PHRASES
+        self.min_delay = config.WORDSTAT_POLL_MIN
+        self.max_delay = config.WORDSTAT_POLL_MAX
+        self.report_timeout = config.WORDSTAT_REPORT_TIMEOUT
+
+        # geo -> phrase -> waiting futures, both in arrival order
+        self._pending: OrderedDict[tuple, OrderedDict[str, list]] = OrderedDict()
+        self._in_flight: dict[int, _Report] = {}
+        # Reports on the account that were not created by us still occupy slots
+        self._foreign_reports = 0
+        self._wakeup: asyncio.Event = None
+        self._task: asyncio.Task = None
+
+    async def collect(self, phrases: list[str], geo_id: list[int] = None) -> list:
+        """
+        Queues phrases and waits for their reports.
+        Returns one entry per phrase: list of (keyword, shows), or None if its report failed.
+        """
+        if not phrases:
+            return []
+
+        loop = asyncio.get_running_loop()
+        geo = tuple(sorted(geo_id)) if geo_id else (0,)
+        futures = []
+
+        for phrase in phrases:
+            future = loop.create_future()
+            futures.append(future)
+
+            # Piggyback on a report that already carries this phrase
+            running = next(
+                (r for r in self._in_flight.values() if r.geo == geo and phrase in r.waiters),
+                None
+            )
+            if running:
+                running.waiters[phrase].append(future)
+                continue
+
+            self._pending.setdefault(geo, OrderedDict()).setdefault(phrase, []).append(future)
+
+        self._ensure_running()
+        self._wakeup.set()
+        return await asyncio.gather(*futures)
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(phrases) for phrases in self._pending.values())
+
+    @property
+    def reports_in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def _ensure_running(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops the scheduler, fails queued callers and deletes reports still on the account.
+        """
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        error = RuntimeError("Wordstat scheduler stopped")
+        for phrases in self._pending.values():
+            for waiters in phrases.values():
+                self._resolve(waiters, exc=error)
+        self._pending.clear()
+
+        for report in list(self._in_flight.values()):
+            for waiters in report.waiters.values():
+                self._resolve(waiters, exc=error)
+            try:
+                await self.client.delete_report(report.report_id)
+            except Exception as e:
+                logger.warning(f"Failed to delete report {report.report_id} on stop: {e}")
+        self._in_flight.clear()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        delay = self.min_delay
+        next_poll = loop.time() + delay
+        # Reports left on the account by others count against the limit from the first launch
+        await self._refresh_foreign_reports()
+
+        while True:
+            try:
+                had_reports = bool(self._in_flight)
+                await self._launch_reports()
+                if self._in_flight and not had_reports:
+                    # Fresh batch: start polling from the shortest interval
+                    delay = self.min_delay
+                    next_poll = loop.time() + delay
+
+                if not self._in_flight and not self._pending:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                if self._pending and not self._in_flight:
+                    # All slots held by foreign reports: recount them before retrying
+                    await self._refresh_foreign_reports()
+
+                if self._in_flight and loop.time() >= next_poll:
+                    progressed = await self._poll()
+                    delay = self.min_delay if progressed else min(delay * 1.5, self.max_delay)
+                    next_poll = loop.time() + delay
+
+                self._wakeup.clear()
+                timeout = max(0.0, next_poll - loop.time()) if self._in_flight else self.min_delay
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Wordstat scheduler loop error: {e}")
+                await asyncio.sleep(self.min_delay)
+
+    async def _launch_reports(self):
+        loop = asyncio.get_running_loop()
+
+        while self._pending and len(self._in_flight) + self._foreign_reports < self.max_reports:
+            geo, queued = next(iter(self._pending.items()))
+
+            # Drop phrases whose callers have all gone away
+            for phrase in [p for p, w in queued.items() if all(f.done() for f in w)]:
+                del queued[phrase]
+
+            batch = list(queued.keys())[:self.max_phrases]
+            waiters = {phrase: queued.pop(phrase) for phrase in batch}
+            if not queued:
+                del self._pending[geo]
+            if not batch:
+                continue
+
+            try:
+                report_id = await self.client.create_report(batch, list(geo))
+            except Exception as e:
+                if getattr(e, "code", None) == REPORT_LIMIT_ERROR:
+                    # Our count was stale: requeue the batch and wait for a slot
+                    logger.warning(f"No free report slot ({e}), {len(batch)} phrases requeued")
+                    self._requeue(geo, waiters)
+                    await self._refresh_foreign_reports()
+                    self._foreign_reports = max(self._foreign_reports, self.max_reports - len(self._in_flight))
+                    break
+                # API-level errors go back to the callers (the handler falls back to mock data)
+                for phrase_waiters in waiters.values():
+                    self._resolve(phrase_waiters, exc=e)
+                continue
+
+            if not report_id:
+                logger.error("Failed to create report")
+                for phrase_waiters in waiters.values():
+                    self._resolve(phrase_waiters, result=None)
+                continue
+
+            self._in_flight[report_id] = _Report(
+                report_id=report_id,
+                geo=geo,
+                phrases=batch,
+                waiters=waiters,
+                deadline=loop.time() + self.report_timeout
+            )
+            logger.info(f"Report {report_id} created for {len(batch)} phrases "
+                        f"({len(self._in_flight)} in flight, {self.queue_depth} queued)")
+
+    def _requeue(self, geo: tuple, waiters: dict[str, list]):
+        # Back to the front of the queue, ahead of phrases queued meanwhile
+        queued = self._pending.pop(geo, OrderedDict())
+        restored = OrderedDict(waiters)
+        for phrase, futures in queued.items():
+            restored.setdefault(phrase, []).extend(futures)
+        self._pending[geo] = restored
+        self._pending.move_to_end(geo, last=False)
+
+    async def _refresh_foreign_reports(self):
+        try:
+            reports = await self.client.get_report_list()
+        except Exception as e:
+            logger.warning(f"Report list poll failed: {e}")
+            return
+        if reports is not None:
+            self._foreign_reports = len([r for r in reports if r['ReportID'] not in self._in_flight])
+
+    async def _poll(self) -> bool:
+        """
+        One list call for all in-flight reports. Returns True if any report finished.
+        """
+        try:
+            reports = await self.client.get_report_list()
+        except Exception as e:
+            logger.warning(f"Report list poll failed: {e}")
+            return False
+
+        if reports is None:
+            return False
+
+        statuses = {r['ReportID']: r['StatusReport'] for r in reports}
+        self._foreign_reports = len([rid for rid in statuses if rid not in self._in_flight])
+
+        loop = asyncio.get_running_loop()
+        progressed = False
+
+        for report in list(self._in_flight.values()):
+            status = statuses.get(report.report_id)
+            logger.debug(f"Report {report.report_id} status: {status}")
+
+            if status == "Done":
+                await self._finish(report)
+                progressed = True
+            elif status is None:
+                logger.warning(f"Report {report.report_id} vanished from list.")
+                self._fail(report)
+                progressed = True
+            elif status in ["Failed", "Error"]:
+                logger.error(f"Report {report.report_id} generation failed.")
+                await self._discard(report)
+                progressed = True
+            elif loop.time() > report.deadline:
+                logger.error(f"Timeout waiting for report {report.report_id}.")
+                await self._discard(report)
+                progressed = True
+
+        return progressed
+
+    async def _finish(self, report: _Report):
+        del self._in_flight[report.report_id]
+        try:
+            raw_data = await self.client.get_report(report.report_id)
+        except Exception as e:
+            logger.error(f"Failed to download report {report.report_id}: {e}")
+            raw_data = None
+
+        try:
+            await self.client.delete_report(report.report_id) # Cleanup
+        except Exception as e:
+            logger.warning(f"Failed to delete report {report.report_id}: {e}")
+
+        if raw_data is None:
+            # Failed download: callers get None (as for a failed create), never an empty result
+            logger.error(f"Report {report.report_id} could not be downloaded")
+            for waiters in report.waiters.values():
+                self._resolve(waiters, result=None)
+            return
+
+        # Entries come back in request order; match by phrase first, by position otherwise
+        by_phrase = {entry.get('Phrase'): entry for entry in raw_data}
+        for index, phrase in enumerate(report.phrases):
+            entry = by_phrase.get(phrase)
+            if entry is None and index < len(raw_data):
+                entry = raw_data[index]
+
+            if entry is None:
+                # Missing from the report: unknown, not "no keywords"
+                self._resolve(report.waiters[phrase], result=None)
+                continue
+
+            results = []
+            # 'SearchedWith' contains the gathered keywords
+            for item in entry.get('SearchedWith', []):
+                results.append((item['Phrase'], item['Shows']))
+            self._resolve(report.waiters[phrase], result=results)
+
+        logger.info(f"Report {report.report_id} delivered to {sum(len(w) for w in report.waiters.values())} waiters")
+
+    async def _discard(self, report: _Report):
+        self._fail(report)
+        try:
+            await self.client.delete_report(report.report_id)
+        except Exception as e:
+            logger.warning(f"Failed to delete report {report.report_id}: {e}")
+
+    def _fail(self, report: _Report):
+        self._in_flight.pop(report.report_id, None)
+        for waiters in report.waiters.values():
+            self._resolve(waiters, result=None)
+
+    @staticmethod
+    def _resolve(futures: list, result=None, exc: Exception = None):
+        for future in futures:
+            if future.done():
+                continue
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
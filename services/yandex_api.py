@@ -2,10 +2,36 @@ import asyncio
 import json
 import aiohttp
 from config import config
+from services.wordstat_cache import WordstatCache
+from services.wordstat_scheduler import WordstatScheduler
 from utils.logger import get_logger
 
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the stdlib decoder
+    orjson = None
+
 logger = get_logger("yandex_service")
 
+def _json_dumps(payload) -> bytes:
+    # Both variants keep non-ASCII characters unescaped, as the v4 API expects
+    if orjson:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+def _json_loads(raw):
+    if orjson:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+class YandexAPIError(Exception):
+    """
+    Logic error answered by the API; code is its error_code.
+    """
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
 class YandexService:
     BASE_URL = "https://api.direct.yandex.com/v4/json/"
 
@@ -15,6 +41,49 @@ class YandexService:
         self.headers = {
             "Content-Type": "application/json; charset=utf-8",
         }
+        self._session: aiohttp.ClientSession = None
+        # Shares report slots and list polling between all users
+        self.scheduler = WordstatScheduler(self)
+        self.cache = WordstatCache()
+
+    async def start(self):
+        """
+        Opens the shared keep-alive session. Called on dispatcher startup.
+        """
+        if self._session and not self._session.closed:
+            return
+
+        connector = aiohttp.TCPConnector(
+            limit=config.YANDEX_POOL_SIZE,
+            keepalive_timeout=config.YANDEX_KEEPALIVE,
+            ttl_dns_cache=300
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=config.YANDEX_REQUEST_TIMEOUT,
+            sock_connect=config.YANDEX_CONNECT_TIMEOUT
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            headers=self.headers
+        )
+        logger.info(f"Yandex HTTP session opened (pool={config.YANDEX_POOL_SIZE})")
+
+    async def close(self):
+        """
+        Closes the shared session. Called on dispatcher shutdown.
+        """
+        await self.scheduler.stop()
+        if self._session and not self._session.closed:
+            await self._session.close()
+            logger.info("Yandex HTTP session closed")
+        self._session = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        # Lazily open the session if the service is used outside the bot lifecycle
+        if not self._session or self._session.closed:
+            await self.start()
+        return self._session
 
     async def _request(self, method: str, params: dict):
         payload = {
@@ -25,22 +94,23 @@ class YandexService:
         }
         
         # Manually dump to ensure utf-8 non-escaped characters
-        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(self.BASE_URL, data=data, headers=self.headers) as resp:
-                if resp.status != 200:
-                    text = await resp.text()
-                    logger.error(f"Yandex API Error {resp.status}: {text}")
-                    return None
-                
-                data = await resp.json()
-                if "error_code" in data:
-                    err_detail = data['error_detail']
-                    logger.error(f"Yandex API Logic Error: {err_detail}")
-                    raise Exception(f"Yandex API: {err_detail}")
-                    
-                return data.get("data")
+        data = _json_dumps(payload)
+
+        session = await self._get_session()
+        async with session.post(self.BASE_URL, data=data) as resp:
+            if resp.status != 200:
+                text = await resp.text()
+                logger.error(f"Yandex API Error {resp.status}: {text}")
+                return None
+
+            # Wordstat reports are large; decode the raw body with the fast parser
+            data = _json_loads(await resp.read())
+            if "error_code" in data:
+                err_detail = data['error_detail']
+                logger.error(f"Yandex API Logic Error: {err_detail}")
+                raise YandexAPIError(data['error_code'], f"Yandex API: {err_detail}")
+
+            return data.get("data")
 
     async def create_report(self, phrases: list[str], geo_id: list[int] = None) -> int:
         """
@@ -70,52 +140,46 @@ class YandexService:
     async def delete_report(self, report_id: int):
         return await self._request("DeleteWordstatReport", report_id)
 
-    async def collect_semantics(self, seed_phrases: list[str]) -> list[tuple[str, int]]:
+    async def collect_semantics(self, seed_phrases: list[str], geo_id: list[int] = None,
+                                refresh: bool = False) -> list[tuple[str, int]]:
         """
         High-level orchestration: Create -> Wait -> Download -> Delete.
+        Phrases found in the local cache skip the API entirely; the rest are batched
+        and polled by the shared WordstatScheduler. refresh=True bypasses cached results.
+        Only results of delivered reports are cached: a failed, vanished or timed-out report
+        contributes nothing and is asked for again next time. API errors propagate.
         Returns: list of (keyword, shows)
         """
-        report_id = await self.create_report(seed_phrases)
-        if not report_id:
-            logger.error("Failed to create report")
-            return []
-            
-        logger.info(f"Report {report_id} created. Waiting for readiness...")
-        
-        # Poll for status
-        for _ in range(20): # Max wait ~2 mins
-            await asyncio.sleep(5)
-            reports = await self.get_report_list()
-            
-            target_report = next((r for r in reports if r['ReportID'] == report_id), None)
-            
-            if not target_report:
-                logger.warning(f"Report {report_id} vanished from list.")
-                return []
-                
-            status = target_report['StatusReport']
-            logger.debug(f"Report {report_id} status: {status}")
-            
-            if status == "Done":
-                logger.info("Report ready. Downloading...")
-                raw_data = await self.get_report(report_id)
-                await self.delete_report(report_id) # Cleanup
-                
-                # Parse
-                results = []
-                for entry in raw_data:
-                    # 'SearchedWith' contains the gathered keywords
-                    for item in entry.get('SearchedWith', []):
-                        results.append((item['Phrase'], item['Shows']))
-                return results
-                
-            elif status in ["Failed", "Error"]:
-                logger.error("Report generation failed.")
-                await self.delete_report(report_id)
-                return []
-        
-        logger.error("Timeout waiting for report.")
-        return []
+        per_phrase = {}
+        missing = []
+        for phrase in seed_phrases:
+            cached = None if refresh else await asyncio.to_thread(self.cache.get, phrase, geo_id)
+            if cached is not None:
+                per_phrase[phrase] = cached
+            elif phrase not in missing:
+                missing.append(phrase)
+
+        if len(missing) < len(seed_phrases):
+            logger.info(f"Wordstat cache: {len(seed_phrases) - len(missing)} hit(s), {len(missing)} miss(es). "
+                        f"Stats: {self.cache.stats}")
+
+        if missing:
+            fetched = await self.scheduler.collect(missing, geo_id)
+            failed = [phrase for phrase, phrase_results in zip(missing, fetched) if phrase_results is None]
+            for phrase, phrase_results in zip(missing, fetched):
+                if phrase_results is None:
+                    continue # Failed report: nothing to cache
+                # Only results of a delivered report are cached
+                per_phrase[phrase] = phrase_results
+                await asyncio.to_thread(self.cache.put, phrase, geo_id, phrase_results)
+
+            if failed:
+                logger.warning(f"Wordstat reports failed for {len(failed)} phrase(s): {failed}")
+
+        results = []
+        for phrase in seed_phrases:
+            results.extend(per_phrase.get(phrase) or [])
+        return results
 
     async def collect_semantics_mock(self, seed_phrases: list[str]) -> list[tuple[str, int]]:
         """
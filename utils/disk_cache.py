@@ -0,0 +1,163 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from utils.logger import get_logger
+
+logger = get_logger("disk_cache")
+
+class DiskCache:
+    """
+    Small persistent key/value store on top of sqlite.
+    Values are stored as JSON, every entry has its own expiry, and the least
+    recently used entries are evicted once max_entries or max_bytes is exceeded.
+    Safe to share between threads; WAL mode lets several processes read at once.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, max_bytes: int = None, default_ttl: float = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_expires ON entries(expires_at)")
+
+        # REPLACE only fires the delete trigger with recursive triggers on
+        self._conn.execute("PRAGMA recursive_triggers=ON")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS totals (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                count INTEGER NOT NULL,
+                bytes INTEGER NOT NULL
+            )
+        """)
+        self._conn.executescript("""
+            CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+                UPDATE totals SET count = count + 1, bytes = bytes + NEW.size WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+                UPDATE totals SET count = count - 1, bytes = bytes - OLD.size WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_resize AFTER UPDATE OF size ON entries BEGIN
+                UPDATE totals SET bytes = bytes - OLD.size + NEW.size WHERE id = 0;
+            END;
+        """)
+        # Caches created before the totals table are counted once
+        self._conn.execute("""
+            INSERT OR IGNORE INTO totals (id, count, bytes)
+            SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM entries
+        """)
+
+    def get(self, key: str, default=None):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.misses += 1
+                return default
+
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+
+        return json.loads(value)
+
+    def set(self, key: str, value, ttl: float = None):
+        """
+        Stores a JSON-serialisable value. ttl overrides default_ttl; both None means no expiry.
+        """
+        ttl = ttl if ttl is not None else self.default_ttl
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        expires_at = now + ttl if ttl is not None else None
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload.encode('utf-8')), expires_at, now)
+            )
+            self._evict(now)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+
+    def _totals(self) -> tuple[int, int]:
+        return self._conn.execute("SELECT count, bytes FROM totals WHERE id = 0").fetchone()
+
+    def _evict(self, now: float):
+        # Expired entries go first, then least recently used ones until under the limits
+        removed = self._conn.execute(
+            "DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        ).rowcount
+
+        count, total = self._totals()
+        over_count = count - self.max_entries if self.max_entries else 0
+        over_bytes = total - self.max_bytes if self.max_bytes else 0
+
+        if over_count > 0 or over_bytes > 0:
+            victims = []
+            freed = 0
+            for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY accessed_at"):
+                if len(victims) >= over_count and freed >= over_bytes:
+                    break
+                victims.append((key,))
+                freed += size
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+            removed += len(victims)
+
+        if removed:
+            self.evictions += removed
+            logger.debug(f"Evicted {removed} entries from {self.path}")
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._totals()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": count,
+            "bytes": total
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
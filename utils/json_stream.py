@@ -0,0 +1,71 @@
+import json
+
+class JsonStreamParser:
+    """
+    Incremental scanner for a JSON document that arrives in fragments (streamed completions).
+
+    feed() returns (path, value) for every object that closed at nesting depth `depth`,
+    as soon as its closing brace arrives. The path holds the keys and array indices leading
+    to the object: in {"ads": [{...}, {...}]} the ads sit at depth 2 with paths ("ads", 0)
+    and ("ads", 1); in {"clusters": {"3": [{...}]}} the ad sits at depth 3, path ("clusters", "3", 0).
+
+    Only the structure is tracked while scanning; each completed object is decoded with
+    json.loads once. Malformed objects are skipped, the final document is still the
+    caller's to parse.
+    """
+
+    def __init__(self, depth: int):
+        self.depth = depth
+        self.text = []        # Every character received so far
+        self.pos = 0
+        self.stack = []       # Open containers: {"type", "start", "key", "index", "expect_key"}
+        self.in_string = False
+        self.escaped = False
+        self.string_start = 0
+
+    def feed(self, fragment: str) -> list[tuple[tuple, object]]:
+        completed = []
+        for ch in fragment:
+            self.text.append(ch)
+            pos = self.pos
+            self.pos += 1
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+                    top = self.stack[-1] if self.stack else None
+                    if top and top["type"] == "{" and top["expect_key"]:
+                        try:
+                            top["key"] = json.loads("".join(self.text[self.string_start:pos + 1]))
+                        except ValueError:
+                            top["key"] = None
+                continue
+
+            if ch == '"':
+                self.in_string = True
+                self.string_start = pos
+            elif ch in "{[":
+                self.stack.append({"type": ch, "start": pos, "key": None, "index": 0, "expect_key": ch == "{"})
+            elif ch in "}]":
+                if not self.stack:
+                    continue
+                container = self.stack.pop()
+                if ch == "}" and len(self.stack) == self.depth:
+                    path = tuple(c["key"] if c["type"] == "{" else c["index"] for c in self.stack)
+                    try:
+                        completed.append((path, json.loads("".join(self.text[container["start"]:pos + 1]))))
+                    except ValueError:
+                        pass
+            elif ch == ":" and self.stack and self.stack[-1]["type"] == "{":
+                self.stack[-1]["expect_key"] = False
+            elif ch == "," and self.stack:
+                top = self.stack[-1]
+                if top["type"] == "{":
+                    top["expect_key"] = True
+                else:
+                    top["index"] += 1
+        return completed
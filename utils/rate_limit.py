@@ -0,0 +1,54 @@
+import asyncio
+import time
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per minute, holding at most `capacity`
+    (one minute's worth by default). Not thread-safe; meant for one event loop.
+
+    time_until/take let a caller check several buckets before committing to any;
+    acquire is the single-bucket shortcut.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float) -> float:
+        """
+        Seconds until `amount` tokens are available (0 if they are now).
+        Amounts above capacity are treated as a full bucket so they can still pass.
+        """
+        self._refill()
+        missing = min(amount, self.capacity) - self.tokens
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, amount: float):
+        """
+        Removes tokens unconditionally. The balance may go negative (e.g. when actual usage
+        exceeded the estimate), which delays later callers; a negative amount refunds.
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+    def drain(self):
+        # Server-side limit hit: assume the bucket is empty whatever our estimate says
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+    async def acquire(self, amount: float = 1):
+        while True:
+            wait = self.time_until(amount)
+            if wait <= 0:
+                self.take(amount)
+                return
+            await asyncio.sleep(wait)
@@ -0,0 +1,53 @@
+try:
+    import tiktoken
+except ImportError:  # Optional: fall back to a character-based estimate
+    tiktoken = None
+
+# Cyrillic text averages roughly 2.5 characters per token on GPT-4-class tokenizers;
+# the estimate errs on the high side so budgets are not overrun
+CHARS_PER_TOKEN = 2.5
+# Chat formatting overhead per message (role, separators)
+MESSAGE_OVERHEAD = 4
+
+_encoding = None
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:  # Encoding files unavailable offline
+            _encoding = False
+    return _encoding or None
+
+def estimate_tokens(text: str) -> int:
+    """
+    Number of tokens `text` takes in a prompt. Exact with tiktoken installed, an upper-leaning estimate otherwise.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+def estimate_messages_tokens(messages: list[dict]) -> int:
+    return sum(estimate_tokens(m.get("content") or "") + MESSAGE_OVERHEAD for m in messages)
+
+def chunk_by_tokens(items: list[str], budget: int, item_overhead: int = 2) -> list[list[str]]:
+    """
+    Splits items into consecutive chunks whose estimated size stays within budget tokens.
+    item_overhead covers the separators around each item (quotes and a comma in a JSON list).
+    An item larger than the budget gets a chunk of its own.
+    """
+    chunks, current, used = [], [], 0
+    for item in items:
+        cost = estimate_tokens(item) + item_overhead
+        if current and used + cost > budget:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks